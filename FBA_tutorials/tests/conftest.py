@@ -0,0 +1,18 @@
+import cobra
+import os
+import pytest
+import sys
+
+# the tutorials import the helpers as 'utils' from the FBA_tutorials directory
+tutorial_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, tutorial_dir)
+
+
+@pytest.fixture(scope='session')
+def ecoli_path():
+    return os.path.join(tutorial_dir, 'models', 'e_coli_core.json')
+
+
+@pytest.fixture
+def ecoli(ecoli_path):
+    return cobra.io.load_json_model(ecoli_path)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from utils.cell_line_variants import apply_variant, load_variants, model_deltas, save_variants
+
+
+def test_variants_round_trip_keeps_unchanged_lines(ecoli, tmp_path):
+    variant = ecoli.copy()
+    variant.reactions.PGI.bounds = (0.0, 0.0)
+    variant.reactions.EX_glc__D_e.lower_bound = -1.0 / 3
+
+    variants = {'changed': model_deltas(ecoli, variant), 'unchanged': model_deltas(ecoli, ecoli)}
+    path = str(tmp_path / 'variants.csv')
+    save_variants(variants, path)
+    loaded = load_variants(path)
+
+    assert list(loaded) == ['changed', 'unchanged']
+    assert len(loaded['unchanged']) == 0
+    assert loaded['changed'].equals(variants['changed'])
+    assert loaded['changed'].loc['EX_glc__D_e', 'lower_bound'] == -1.0 / 3
+
+
+def test_apply_variant_resets_bounds(ecoli):
+    deltas = pd.DataFrame({'lower_bound': [0.0], 'upper_bound': [0.0]}, index=pd.Index(['PGI'], name='reaction'))
+    growth = ecoli.slim_optimize()
+
+    with apply_variant(ecoli, deltas):
+        assert ecoli.reactions.PGI.bounds == (0.0, 0.0)
+        assert ecoli.slim_optimize() < growth
+
+    assert np.isclose(ecoli.slim_optimize(), growth)
+    assert ecoli.reactions.PGI.bounds == (-1000.0, 1000.0)
@@ -0,0 +1,70 @@
+import cobra
+import itertools
+import numpy as np
+import pytest
+
+from utils.deletion_screen import deletion_screen, deletion_matrix
+
+
+def cobra_growth(result):
+    ''' Growth per gene set of a cobra deletion result, keyed as in deletion_screen. '''
+    return {frozenset(ids): growth for ids, growth in zip(result['ids'], result['growth'])}
+
+
+def test_single_deletions_match_cobra(ecoli):
+    screen = deletion_screen(ecoli, processes=1)
+    expected = cobra_growth(cobra.flux_analysis.single_gene_deletion(ecoli, processes=1))
+
+    assert len(screen) == len(ecoli.genes)
+    for label, growth in screen['growth'].items():
+        assert growth == pytest.approx(expected[frozenset([label])], abs=1e-6, nan_ok=True)
+
+
+def test_double_deletions_match_cobra(ecoli):
+    genes = ['b3916', 'b1723', 'b0767', 'b2029', 'b4025', 'b2914', 'b4090']
+    pairs = list(itertools.combinations(genes, 2))
+
+    screen = deletion_screen(ecoli, genes=[], pairs=pairs, processes=1)
+    expected = cobra_growth(cobra.flux_analysis.double_gene_deletion(ecoli, gene_list1=genes, processes=1))
+
+    for label, growth in screen['growth'].items():
+        assert growth == pytest.approx(expected[frozenset(label.split(';'))], abs=1e-6, nan_ok=True)
+
+
+def test_pool_matches_serial(ecoli):
+    genes = [gene.id for gene in ecoli.genes[:40]]
+    pairs = list(itertools.combinations(genes[:8], 2))
+
+    serial = deletion_screen(ecoli, genes=genes, pairs=pairs, processes=1, chunk_size=5)
+    pooled = deletion_screen(ecoli, genes=genes, pairs=pairs, processes=2, chunk_size=5)
+
+    assert pooled.index.equals(serial.index)
+    assert np.allclose(pooled['growth'], serial['growth'], atol=1e-6, equal_nan=True)
+    assert pooled['reactions'].equals(serial['reactions'])
+
+
+def test_fva_screen_matches_cobra(ecoli):
+    fvaRxns = ['EX_ac_e', 'EX_etoh_e', 'EX_o2_e']
+
+    screen = deletion_screen(ecoli, genes=['b3916', 'b2029', 'b1136'], fvaRxns=fvaRxns,
+                             fraction_of_optimum=0.5, processes=1)
+
+    for gene in screen.index:
+        with ecoli:
+            cobra.manipulation.knock_out_model_genes(ecoli, [gene])
+            fva = cobra.flux_analysis.flux_variability_analysis(ecoli, reaction_list=fvaRxns,
+                                                                fraction_of_optimum=0.5, processes=1)
+        assert np.allclose(screen.loc[gene, 'minimum'][fvaRxns], fva['minimum'][fvaRxns], atol=1e-6)
+        assert np.allclose(screen.loc[gene, 'maximum'][fvaRxns], fva['maximum'][fvaRxns], atol=1e-6)
+
+
+def test_deletion_matrix(ecoli):
+    genes = ['b3916', 'b1723', 'b0767']
+    screen = deletion_screen(ecoli, genes=genes, pairs=[('b3916', 'b1723')], processes=1)
+
+    matrix = deletion_matrix(screen)
+
+    assert list(matrix.index) == genes and list(matrix.columns) == genes
+    assert np.array_equal(np.diag(matrix), screen['growth'][genes].to_numpy())
+    assert matrix.loc['b3916', 'b1723'] == matrix.loc['b1723', 'b3916'] == screen.loc['b3916;b1723', 'growth']
+    assert np.isnan(matrix.loc['b3916', 'b0767'])
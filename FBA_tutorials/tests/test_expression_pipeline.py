@@ -0,0 +1,47 @@
+import cobra
+import numpy as np
+import pandas as pd
+
+from utils.cell_line_variants import expression_deltas
+from utils.expression_pipeline import sample_deltas
+
+
+def knocked_out(model, genes):
+    with model:
+        return {rxn.id for rxn in cobra.manipulation.knock_out_model_genes(model, genes)}
+
+
+def random_expression(model, samples, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(0, 1, (len(model.genes), samples))
+    values[rng.random(values.shape) < 0.2] = 0.0
+    return pd.DataFrame(values, index=[gene.id for gene in model.genes],
+                        columns=['s{}'.format(i) for i in range(samples)])
+
+
+def test_expression_deltas_matches_cobra_knockouts(ecoli):
+    expression = random_expression(ecoli, 1)['s0']
+    deltas = expression_deltas(ecoli, expression, threshold=0.0)
+
+    off = expression.index[expression <= 0.0].tolist()
+    assert set(deltas.index) == knocked_out(ecoli, off)
+    assert (deltas[['lower_bound', 'upper_bound']].to_numpy() == 0.0).all()
+
+
+def test_sample_deltas_streams_all_samples(ecoli):
+    table = random_expression(ecoli, 7, seed=1)
+    deltas = dict(sample_deltas(ecoli, table, threshold=0.0, chunk_size=3))
+
+    assert list(deltas) == list(table.columns)
+    for sample in table.columns:
+        off = table.index[table[sample] <= 0.0].tolist()
+        assert set(deltas[sample].index) == knocked_out(ecoli, off)
+
+
+def test_keep_and_missing_genes(ecoli):
+    expression = pd.Series(0.0, index=[gene.id for gene in ecoli.genes])
+    closed = expression_deltas(ecoli, expression)
+    kept = closed.index[:3].tolist()
+
+    assert not set(kept) & set(expression_deltas(ecoli, expression, keep=kept).index)
+    assert len(expression_deltas(ecoli, expression.iloc[:0])) == 0 # no data: every gene is on
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from utils.findBiomarkers import calcFluxes, findBiomarkersBatch, roundFluxes
+
+
+def test_roundFluxes_rounds_like_python():
+    values = np.random.default_rng(0).uniform(-100, 100, (500, 2))
+    values[0] = [87.2505, -0.0005]
+
+    rounded = roundFluxes(values)
+
+    assert rounded.shape == values.shape
+    assert rounded.ravel().tolist() == [round(v, 3) for v in values.ravel().tolist()]
+
+
+def test_findBiomarkersBatch_skips_infeasible_sets(ecoli, capsys):
+    # without glucose the ATP maintenance bound cannot be met, so the mutant FVA is infeasible
+    exchanges = [rxn for rxn in ecoli.exchanges if rxn.id != 'EX_glc__D_e']
+
+    table = findBiomarkersBatch(ecoli, fvaRxns=exchanges, mods_list=['EX_glc__D_e', 'PGI', 'PGI'],
+                                mode='IEMrxn', processes=1)
+
+    assert 'EX_glc__D_e: FVA could not be solved' in capsys.readouterr().out
+    assert set(table.index.get_level_values('Gene')) == {'PGI'}
+
+
+
+@pytest.mark.parametrize('rxnID', ['PGI', 'MDH', 'PFK'])
+def test_calcFluxes_reuseSolver_matches_copies(ecoli, rxnID):
+    rxn = ecoli.reactions.get_by_id(rxnID)
+
+    reused = calcFluxes(ecoli, [rxn], ecoli.exchanges, 1.0, 0, 'IEMrxn', True, reuseSolver=True)
+    copied = calcFluxes(ecoli, [rxn], ecoli.exchanges, 1.0, 0, 'IEMrxn', True, reuseSolver=False)
+
+    for new, old in zip(reused, copied):
+        assert np.allclose(new.loc[old.index].to_numpy(), old.to_numpy(), atol=1e-9)
+
+
+
+@pytest.mark.parametrize('reuseSolver', [True, False])
+@pytest.mark.parametrize('rxnID, expected', [
+    ('PGI', {'EX_co2_e': (-3.179683, 60.0), 'EX_glc__D_e': (-10.0, -0.515512), 'EX_succ_e': (0.0, 15.391111)}),
+    ('MDH', {'EX_co2_e': (-11.104242, 60.0), 'EX_glc__D_e': (-10.0, -0.716552), 'EX_succ_e': (0.0, 16.384167)})])
+def test_calcFluxes_backward_pass_drops_forward_bounds(ecoli, rxnID, expected, reuseSolver):
+    WTf, WTb, mutant = calcFluxes(ecoli, [ecoli.reactions.get_by_id(rxnID)], ecoli.exchanges, 1.0, 0,
+                                  'IEMrxn', True, reuseSolver=reuseSolver)
+
+    for exchange, interval in expected.items():
+        assert WTb.loc[exchange].tolist() == pytest.approx(interval, abs=1e-5)
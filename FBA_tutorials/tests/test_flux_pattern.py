@@ -0,0 +1,36 @@
+import numpy as np
+
+from utils import fva_cache
+from utils.flux_pattern_function import fva_models
+from utils.model_registry import get_models
+
+
+def test_fva_models_cache_does_not_depend_on_processes(ecoli_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(fva_cache, 'cache_dir', str(tmp_path))
+    fva_cache.cache_stats['hits'] = fva_cache.cache_stats['misses'] = 0
+    model = get_models([ecoli_path])[ecoli_path]
+
+    serial = fva_models({'ecoli': model}, use_cache=True, processes=1)
+    assert fva_cache.cache_stats == {'hits': 0, 'misses': 1}
+
+    pooled = fva_models({'ecoli': model}, use_cache=True, processes=2)
+    assert fva_cache.cache_stats == {'hits': 1, 'misses': 1}
+    assert np.allclose(serial['ecoli'].to_numpy(), pooled['ecoli'].to_numpy())
+
+    uncached = fva_models({'ecoli': model}, processes=2)
+    assert list(uncached['ecoli'].index) == [rxn.id for rxn in model.reactions]
+    assert np.allclose(uncached['ecoli'][['minimum', 'maximum']].to_numpy(),
+                       serial['ecoli'].loc[uncached['ecoli'].index, ['minimum', 'maximum']].to_numpy(), atol=1e-6)
+    assert fva_cache.cache_info()['entries'] == 1
+
+
+def test_fva_models_pool_uses_the_models_in_memory(ecoli):
+    # a change made in this process, and not in the model file, must reach the workers
+    ecoli.reactions.EX_glc__D_e.lower_bound = -5
+
+    serial = fva_models({'ecoli': ecoli}, processes=1)
+    pooled = fva_models({'ecoli': ecoli}, processes=2)
+
+    assert np.allclose(serial['ecoli'][['minimum', 'maximum']].to_numpy(),
+                       pooled['ecoli'][['minimum', 'maximum']].to_numpy(), atol=1e-6)
+    assert pooled['ecoli'].loc['EX_glc__D_e', 'minimum'] >= -5 - 1e-6
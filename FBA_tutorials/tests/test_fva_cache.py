@@ -0,0 +1,37 @@
+import cobra
+import numpy as np
+
+from utils import fva_cache
+from utils.fva_cache import cached_fva, fva_key, stoichiometry_key
+
+
+def test_cached_fva_hits_and_misses(ecoli, tmp_path):
+    fva_cache.cache_stats['hits'] = fva_cache.cache_stats['misses'] = 0
+    rxns = [rxn.id for rxn in ecoli.exchanges]
+
+    first = cached_fva(ecoli, rxns, fraction_of_optimum=0.9, directory=str(tmp_path), processes=1)
+    again = cached_fva(ecoli, rxns, fraction_of_optimum=0.9, directory=str(tmp_path), processes=1)
+    reference = cobra.flux_analysis.flux_variability_analysis(ecoli, rxns, fraction_of_optimum=0.9)
+
+    assert fva_cache.cache_stats == {'hits': 1, 'misses': 1}
+    assert np.allclose(again.loc[rxns].to_numpy(), reference.loc[rxns, ['minimum', 'maximum']].to_numpy())
+    assert np.array_equal(first.to_numpy(), again.to_numpy())
+    assert fva_cache.cache_info(str(tmp_path))['entries'] == 1
+
+    with ecoli:
+        ecoli.reactions.EX_glc__D_e.lower_bound = -5
+        cached_fva(ecoli, rxns, fraction_of_optimum=0.9, directory=str(tmp_path), processes=1)
+    assert fva_cache.cache_stats['misses'] == 2
+
+
+def test_stoichiometry_key_follows_changes(ecoli, ecoli_path):
+    key = stoichiometry_key(ecoli)
+    assert stoichiometry_key(cobra.io.load_json_model(ecoli_path)) == key
+
+    rxnIDs = [rxn.id for rxn in ecoli.reactions]
+    before = fva_key(ecoli, rxnIDs, 1.0, {})
+    with ecoli:
+        ecoli.reactions.PGI.add_metabolites({ecoli.metabolites.h_c: 1})
+        assert stoichiometry_key(ecoli) != key
+        assert fva_key(ecoli, rxnIDs, 1.0, {}) != before
+    assert stoichiometry_key(ecoli) == key
@@ -0,0 +1,63 @@
+import cobra
+import numpy as np
+import pickle
+import pytest
+from scipy import sparse
+
+from utils.gpr_map import GPRMap, gpr_map
+
+
+def test_blocked_matches_rule_evaluation(ecoli):
+    rules = GPRMap(ecoli)
+    off = np.random.default_rng(0).random((len(ecoli.genes), 50)) < 0.3
+
+    blocked = rules.blocked(off).toarray()
+
+    for k in range(off.shape[1]):
+        knockouts = {gene.id for gene, isOff in zip(ecoli.genes, off[:, k]) if isOff}
+        expected = [bool(rxn.gene_reaction_rule) and not rxn.gpr.eval(knockouts) for rxn in ecoli.reactions]
+        assert blocked[:, k].tolist() == expected
+
+
+def test_blocked_accepts_sparse_input(ecoli):
+    rules = GPRMap(ecoli)
+    off = np.random.default_rng(1).random((len(ecoli.genes), 5)) < 0.3
+
+    assert (rules.blocked(sparse.csr_matrix(off)) != rules.blocked(off)).nnz == 0
+    with pytest.raises(ValueError):
+        rules.blocked(off[:-1])
+
+
+
+def test_knockouts_match_cobra(ecoli):
+    rules = gpr_map(ecoli)
+    geneSets = [[gene.id] for gene in ecoli.genes] + [['b3916', 'b1723'], ['b0767', 'b2029'], ['b3916', 'b1723']]
+
+    found = rules.knockouts(geneSets)
+
+    for geneSet, rxnSet in zip(geneSets, found):
+        with ecoli:
+            expected = {rxn.id for rxn in cobra.manipulation.knock_out_model_genes(ecoli, geneSet)}
+        assert {rules.reaction_ids[j] for j in rxnSet} == expected
+    assert rules.knockouts([[ecoli.genes.b3916, ecoli.genes.b1723]]) == [found[-1]]
+
+
+def test_gpr_map_is_kept_until_a_rule_changes(ecoli):
+    rules = gpr_map(ecoli)
+    assert gpr_map(ecoli) is rules
+
+    ecoli.reactions.PFK.gene_reaction_rule = 'b3916'
+    changed = gpr_map(ecoli)
+    assert changed is not rules
+    assert changed.knockouts([['b3916']]) == [(changed.reaction_index['PFK'],)]
+
+
+def test_gpr_map_survives_pickling(ecoli):
+    rules = gpr_map(ecoli)
+    rules.knockouts([['b3916']])
+
+    copy = pickle.loads(pickle.dumps(ecoli))
+    unpickled = copy._gpr_map
+
+    assert gpr_map(copy) is unpickled # not compiled again
+    assert gpr_map(copy).knockouts([['b1723']]) == rules.knockouts([['b1723']])
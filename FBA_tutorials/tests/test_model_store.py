@@ -0,0 +1,41 @@
+import cobra
+import numpy as np
+import pytest
+
+from utils.model_store import StoredModel, convert_model, load_model_store, save_model_store
+
+
+def test_round_trip_keeps_the_model(ecoli, tmp_path):
+    path = str(tmp_path / 'e_coli_core.npmodel')
+    save_model_store(ecoli, path)
+    loaded = load_model_store(path)
+
+    assert [rxn.id for rxn in loaded.reactions] == [rxn.id for rxn in ecoli.reactions]
+    assert [met.id for met in loaded.metabolites] == [met.id for met in ecoli.metabolites]
+    assert [gene.id for gene in loaded.genes] == [gene.id for gene in ecoli.genes]
+    for rxn in ecoli.reactions:
+        copy = loaded.reactions.get_by_id(rxn.id)
+        assert copy.bounds == rxn.bounds
+        assert copy.gene_reaction_rule == rxn.gene_reaction_rule
+        assert copy.subsystem == rxn.subsystem
+        assert {met.id: coef for met, coef in copy.metabolites.items()} == \
+               {met.id: coef for met, coef in rxn.metabolites.items()}
+    assert loaded.reactions.BIOMASS_Ecoli_core_w_GAM.annotation == ecoli.reactions.BIOMASS_Ecoli_core_w_GAM.annotation
+
+    assert loaded.slim_optimize() == pytest.approx(ecoli.slim_optimize())
+
+
+def test_stored_model_arrays(ecoli, tmp_path):
+    path = str(tmp_path / 'e_coli_core.npmodel')
+    save_model_store(ecoli, path)
+    stored = StoredModel(path)
+
+    assert stored.reaction_ids == [rxn.id for rxn in ecoli.reactions]
+    assert np.array_equal(stored.lower_bounds, [rxn.lower_bound for rxn in ecoli.reactions])
+    assert np.array_equal(stored.S.toarray(), cobra.util.create_stoichiometric_matrix(ecoli))
+
+
+def test_convert_model(ecoli_path, tmp_path):
+    path = convert_model(ecoli_path, str(tmp_path / 'store.npmodel'))
+
+    assert len(load_model_store(path, annotations=False).reactions) == 95
@@ -1,2 +1,2 @@
-from .findBiomarkers import findBiomarkers
+from .findBiomarkers import findBiomarkers, findBiomarkersBatch
 from .show_map import show_map
\ No newline at end of file
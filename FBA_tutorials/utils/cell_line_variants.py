@@ -0,0 +1,137 @@
+import numpy as np
+import os
+import pandas as pd
+from contextlib import contextmanager
+
+
+# columns of a delta table and of the file written by save_variants
+delta_columns = ['lower_bound', 'upper_bound']
+
+
+def read_expression(path, cell_line=None):
+    ''' Read expression data as a pandas Series: gene ID -> FPKM.
+
+    path:       A *_FPKM_Recon3_ids.csv file (columns entrez_id and <cell line>_FPKM), or the
+                pickled total_dataset table with one column per cell line.
+    cell_line:  The column to return from total_dataset. Without it the whole table is
+                returned.
+    '''
+    if path.endswith('.csv'):
+        data = pd.read_csv(path, index_col='entrez_id', dtype={'entrez_id': str})
+        data = data.drop(columns=[c for c in data.columns if c.startswith('Unnamed')])
+        return data.iloc[:, 0].rename(data.columns[0].replace('_FPKM', ''))
+
+    data = pd.read_pickle(path)
+    return data if cell_line is None else data[cell_line]
+
+
+
+def expression_deltas(model, expression, threshold=0.0, keep=None):
+    ''' Return the knockouts of a cell line as a delta table on model.
+
+    Genes with an FPKM at or below threshold are taken to be off. Every reaction whose gene
+    rule is false with those genes off is closed. Genes without expression data are taken to
+    be on. For many samples at once use expression_pipeline.sample_deltas.
+
+    Closing every such reaction can block the objective. Pass the reactions that must stay
+    open as keep, e.g. the ones that carry flux in a pFBA solution of the base model.
+
+    model:      The base model, e.g. Recon3DModel_301_simple_medium.json
+    expression: A Series gene ID -> FPKM, see read_expression.
+    threshold:  FPKM value at or below which a gene counts as not expressed.
+    keep:       Reactions (IDs or objects) that are never closed.
+
+    Returns a DataFrame indexed by reaction ID with the new lower_bound and upper_bound.
+    '''
+    from .expression_pipeline import sample_deltas
+
+    sample, deltas = next(sample_deltas(model, expression.to_frame(), threshold=threshold, keep=keep))
+
+    return deltas
+
+
+
+def model_deltas(model, variant):
+    ''' Return the bound changes that turn model into variant as a delta table.
+
+    Use this to encode a complete cell line model, like the pickled ones built from the
+    expression data, as a delta on the base model. Reactions of model that are missing from
+    variant are closed. Reactions of variant that model lacks cannot be encoded as bounds and
+    raise a ValueError.
+    '''
+    extra = [rxn.id for rxn in variant.reactions if rxn.id not in model.reactions]
+    if extra:
+        raise ValueError('{} has {} reactions that are not in {}, e.g. {}.'.format(
+            variant.id, len(extra), model.id, ', '.join(extra[:5])))
+
+    changed = {}
+    for rxn in model.reactions:
+        bounds = variant.reactions.get_by_id(rxn.id).bounds if rxn.id in variant.reactions else (0.0, 0.0)
+        if bounds != rxn.bounds:
+            changed[rxn.id] = bounds
+
+    return pd.DataFrame.from_dict(changed, orient='index', columns=delta_columns,
+                                  dtype=np.float64).rename_axis('reaction')
+
+
+
+@contextmanager
+def apply_variant(model, deltas):
+    ''' Apply a delta table to model for the duration of a with block.
+
+    The bounds are changed on the model's own solver and reset when the block ends, so one
+    loaded base model serves every cell line without copies:
+
+        for cell_line, deltas in variants.items():
+            with apply_variant(model, deltas):
+                solution = model.optimize()
+    '''
+    with model:
+        reactions = model.reactions
+        for rxnID, lb, ub in zip(deltas.index, deltas['lower_bound'].tolist(), deltas['upper_bound'].tolist()):
+            reactions.get_by_id(rxnID).bounds = (lb, ub)
+        yield model
+
+
+
+def save_variants(variants, path):
+    ''' Write the delta tables of several cell lines to one csv file.
+
+    variants:   {cell line: delta table}, as returned by expression_deltas or model_deltas
+    path:       The file to write. Only the changed reactions are stored, so it stays small
+                however many cell lines it holds. A cell line without changes gets one row
+                without a reaction, so that load_variants still returns it.
+    '''
+    tables = []
+    for cell_line, deltas in variants.items():
+        deltas = deltas[delta_columns]
+        if len(deltas) == 0:
+            deltas = pd.DataFrame(np.nan, index=pd.Index([np.nan], name='reaction'), columns=delta_columns)
+        tables.append(deltas.assign(cell_line=cell_line).rename_axis('reaction').reset_index())
+
+    columns = ['cell_line', 'reaction'] + delta_columns
+    table = pd.concat(tables)[columns] if tables else pd.DataFrame(columns=columns)
+
+    tmp = path + '.{}.tmp'.format(os.getpid())
+    table.to_csv(tmp, index=False, float_format='%.17g')
+    os.replace(tmp, path)
+
+
+
+def load_variants(path, cell_lines=None):
+    ''' Read the file written by save_variants as {cell line: delta table}.
+
+    cell_lines: The cell lines to return, all of them if None. A cell line without changes
+                gets an empty table.
+    '''
+    table = pd.read_csv(path, dtype={'cell_line': str, 'reaction': str,
+                                     'lower_bound': np.float64, 'upper_bound': np.float64})
+    if cell_lines is None:
+        cell_lines = table['cell_line'].unique().tolist()
+
+    table = table[table['reaction'].notna()].set_index('reaction')
+    groups = {cell_line: group[delta_columns] for cell_line, group in table.groupby('cell_line', sort=False)}
+    empty = pd.DataFrame(columns=delta_columns, dtype=np.float64).rename_axis('reaction')
+
+    return {cell_line: groups[cell_line] if cell_line in groups else empty.copy()
+            for cell_line in cell_lines}
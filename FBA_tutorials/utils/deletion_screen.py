@@ -0,0 +1,154 @@
+import cobra
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from tqdm import tqdm_notebook # progress bars
+
+from .findBiomarkers import knockout
+from .gpr_map import gpr_map
+
+
+def deletion_screen(model, genes=None, pairs=[], fvaRxns=None, fraction_of_optimum=1.0, processes=None,
+                    chunk_size=50):
+    ''' Knock out genes and gene pairs one set at a time and record the objective value (FBA),
+    or the FVA intervals of chosen reactions, of every knockout.
+
+    A gene set is knocked out as in findBiomarkers: both bounds of the reactions its loss blocks
+    are set to 0. The blocked reactions come from the compiled rules (gpr_map.py), and only
+    unique reaction sets are solved: gene sets that block the same reactions share one run.
+    For FBA, sets whose blocked reactions carry no flux in the wild-type solution keep the
+    wild-type value and are not solved at all. Each worker process receives the model once
+    and reuses its solver for all its knockouts.
+
+    model:                  A COBRApy model object
+    genes:                  Genes (IDs or objects) to knock out one by one. Defaults to all genes;
+                            pass [] for a screen of pairs only.
+    pairs:                  Gene pairs (or larger sets) to knock out together.
+    fvaRxns:                Reactions (IDs or objects) to run FVA on, e.g. exchange reactions.
+                            If None, the objective value is recorded (FBA).
+    fraction_of_optimum:    As in flux_variability_analysis.
+    processes:              Number of worker processes. Defaults to the number of CPUs.
+    chunk_size:             Number of knockouts sent to a worker at once.
+
+    Returns a DataFrame indexed by the gene sets (IDs joined with ';', as in
+    findBiomarkersBatch). The 'reactions' column holds the number of blocked reactions. For FBA
+    the 'growth' column holds the objective value, for FVA the columns are ('minimum', rxnID)
+    and ('maximum', rxnID). Infeasible knockouts are NaN. See deletion_matrix for a gene x gene
+    view of a screen of pairs.
+    '''
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    rules = gpr_map(model)
+    if genes is None:
+        genes = rules.gene_ids
+
+    geneSets = [[getattr(gene, 'id', gene)] for gene in genes] + \
+               [[getattr(gene, 'id', gene) for gene in pair] for pair in pairs]
+    labels = [';'.join(geneSet) for geneSet in geneSets]
+    rxnSets = rules.knockouts(geneSets)
+
+    if fvaRxns is not None:
+        fvaRxnIDs = [getattr(rxn, 'id', rxn) for rxn in fvaRxns]
+        unique = list(dict.fromkeys(rxnSets))
+        values = {}
+    else:
+        fvaRxnIDs = None
+        solution = model.optimize()
+        wildType = solution.objective_value if solution.status == 'optimal' else np.nan
+        carriesFlux = np.abs(solution.fluxes.to_numpy()) > model.tolerance
+
+        # knockouts of reactions without flux leave the wild-type solution optimal
+        unique = [rxnSet for rxnSet in dict.fromkeys(rxnSets) if carriesFlux[list(rxnSet)].any()]
+        values = {rxnSet: wildType for rxnSet in set(rxnSets) if not carriesFlux[list(rxnSet)].any()}
+
+    print('{} gene sets block {} unique reaction sets that need a run.'.format(len(geneSets), len(unique)))
+
+    jobs = [unique[start:start + chunk_size] for start in range(0, len(unique), chunk_size)]
+
+    if processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(processes, len(jobs)), initializer=init_screen_worker,
+                                    initargs=(model, fvaRxnIDs, fraction_of_optimum))
+        try:
+            results = list(tqdm_notebook(pool.imap(screen_worker, jobs), total=len(jobs)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [screen_sets(model, job, fvaRxnIDs, fraction_of_optimum) for job in tqdm_notebook(jobs)]
+
+    values.update(zip(unique, itertools.chain.from_iterable(results)))
+
+    index = pd.Index(labels, name='genes')
+    if fvaRxnIDs is None:
+        table = pd.DataFrame({'growth': [values[rxnSet] for rxnSet in rxnSets]}, index=index)
+    else:
+        columns = pd.MultiIndex.from_product([['minimum', 'maximum'], fvaRxnIDs])
+        table = pd.DataFrame(np.array([values[rxnSet] for rxnSet in rxnSets]).reshape(len(rxnSets), -1),
+                             index=index, columns=columns)
+    table['reactions'] = [len(rxnSet) for rxnSet in rxnSets]
+
+    return table
+
+
+
+def screen_sets(model, rxnSets, fvaRxnIDs, fraction_of_optimum):
+    ''' Knock out each reaction set (tuples of reaction indices) in turn on the same solver.
+    Returns the objective values, or for FVA the minima followed by the maxima. '''
+    results = []
+    for rxnSet in rxnSets:
+        with model:
+            knockout(model, [model.reactions[j] for j in rxnSet])
+
+            if fvaRxnIDs is None:
+                results.append(model.slim_optimize(error_value=np.nan))
+                continue
+
+            try:
+                fva = cobra.flux_analysis.flux_variability_analysis(
+                    model, reaction_list=fvaRxnIDs, fraction_of_optimum=fraction_of_optimum, processes=1)
+            except cobra.exceptions.OptimizationError: # the knockout is infeasible
+                results.append(np.full(2*len(fvaRxnIDs), np.nan))
+            else:
+                results.append(np.concatenate([fva.loc[fvaRxnIDs, 'minimum'].to_numpy(),
+                                               fva.loc[fvaRxnIDs, 'maximum'].to_numpy()]))
+
+    return results
+
+
+
+def init_screen_worker(model, fvaRxnIDs, fraction_of_optimum):
+    ''' Pool initializer. Keeps the model and the settings in the worker process, so the model
+    is transferred and its solver built once per worker. '''
+    global screenModel, screenSettings
+
+    screenModel = model
+    screenSettings = (fvaRxnIDs, fraction_of_optimum)
+
+
+
+def screen_worker(rxnSets):
+    ''' Pool job. Run a chunk of knockouts on the worker's model. '''
+    return screen_sets(screenModel, rxnSets, *screenSettings)
+
+
+
+def deletion_matrix(screen, column='growth'):
+    ''' Return a column of a deletion_screen result as a symmetric gene x gene DataFrame: pairs
+    off the diagonal, single genes on it and NaN for pairs that were not screened. '''
+    values = screen[column]
+    geneSets = [label.split(';') for label in screen.index]
+    genes = list(dict.fromkeys(gene for geneSet in geneSets for gene in geneSet))
+    position = {gene: i for i, gene in enumerate(genes)}
+
+    matrix = np.full((len(genes), len(genes)), np.nan)
+    for geneSet, value in zip(geneSets, values.to_numpy()):
+        if len(geneSet) == 1:
+            matrix[position[geneSet[0]], position[geneSet[0]]] = value
+        elif len(geneSet) == 2:
+            i, j = position[geneSet[0]], position[geneSet[1]]
+            matrix[i, j] = matrix[j, i] = value
+
+    return pd.DataFrame(matrix, index=genes, columns=genes)
@@ -4,18 +4,26 @@
 # In[ ]:
 
 def df_plot(target_ss, f_pattern):
+    '''
+Total flux per target subsystem and cell line.
+
+f_pattern : either the { cell_line: DataFrame of flux pattern} returned by flux_pattern, or the
+            wide table returned by flux_table / load_flux_table.
+    '''
     
     import pandas as pd
+    from .flux_table_function import flux_table, subsystem_totals
     
-    df  = pd.DataFrame(target_ss,columns=['subSystems', 'ss_type'])
-    for cell_line in f_pattern.keys():
-        values = []
-        for i in range(len(target_ss)):
-            SUM = f_pattern[cell_line].fluxes[f_pattern[cell_line].subSystem == target_ss[i][0]].sum()
+    if isinstance(f_pattern, dict):
+        f_pattern = flux_table(f_pattern)
 
-            values.append(SUM)
+    # one groupby gives the totals of all subsystems in all cell lines
+    totals = subsystem_totals(f_pattern)
+    totals = totals.reindex([ss[0] for ss in target_ss]).fillna(0)
 
-        df[cell_line] = values
+    df  = pd.DataFrame(target_ss,columns=['subSystems', 'ss_type'])
+    for cell_line in totals.columns:
+        df[cell_line] = totals[cell_line].values
 
     return df
 
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from .cell_line_variants import delta_columns
+from .gpr_map import gpr_map
+
+
+def expression_chunks(sources, chunk_size=64, index_col='entrez_id'):
+    ''' Read FPKM tables as a stream of (genes x samples) DataFrames of at most chunk_size samples.
+
+    sources:    A table or a list of tables, each a DataFrame, a csv file or a pickled
+                DataFrame (like total_dataset) with genes as rows and samples as columns.
+                A csv file is read chunk_size columns at a time, so a file with hundreds of
+                samples is never in memory at once. Single sample files like
+                MCF7_FPKM_Recon3_ids.csv are gathered into one chunk; their '_FPKM' column
+                suffix is dropped.
+    chunk_size: Number of samples per chunk.
+    index_col:  The gene ID column of the csv files.
+    '''
+    if isinstance(sources, (str, pd.DataFrame)):
+        sources = [sources]
+
+    buffered, n = [], 0
+    for source in sources:
+        for piece in table_pieces(source, chunk_size, index_col):
+            buffered.append(piece[~piece.index.duplicated()])
+            n += piece.shape[1]
+            if n >= chunk_size:
+                yield pd.concat(buffered, axis=1, sort=False)
+                buffered, n = [], 0
+
+    if buffered:
+        yield pd.concat(buffered, axis=1, sort=False)
+
+
+
+def table_pieces(source, chunk_size, index_col):
+    ''' Yield the columns of one expression table in blocks of at most chunk_size. '''
+    if isinstance(source, pd.DataFrame):
+        table = source
+    elif source.endswith('.csv'):
+        samples = [c for c in pd.read_csv(source, nrows=0).columns
+                   if c != index_col and not c.startswith('Unnamed')]
+        for start in range(0, len(samples), chunk_size):
+            piece = pd.read_csv(source, usecols=[index_col] + samples[start:start + chunk_size],
+                                index_col=index_col, dtype={index_col: str})
+            yield piece.rename(columns=lambda c: c[:-len('_FPKM')] if c.endswith('_FPKM') else c)
+        return
+    else:
+        table = pd.read_pickle(source)
+
+    for start in range(0, table.shape[1], chunk_size):
+        yield table.iloc[:, start:start + chunk_size]
+
+
+
+def expression_matrix(gpr_map, chunk):
+    ''' Return the FPKM values of a chunk as an array (genes x samples) in the gene order of
+    gpr_map, NaN for genes that are not in the chunk.
+
+    An index of floats (total_dataset turns gene 5152.10 into 5152.1) is matched on the numeric
+    value of the gene IDs. The transcripts of one gene have the same FPKM, so nothing is lost.
+    '''
+    if pd.api.types.is_numeric_dtype(chunk.index):
+        keys = pd.to_numeric(pd.Series(gpr_map.gene_ids), errors='coerce')
+    else:
+        keys = pd.Index(gpr_map.gene_ids)
+
+    return chunk.reindex(keys).to_numpy(dtype=np.float64)
+
+
+
+def sample_deltas(model, sources, threshold=0.0, keep=None, chunk_size=64):
+    ''' Stream FPKM tables through the gene reaction rules of model and yield the bound delta
+    of every sample, as (sample name, delta table).
+
+    Genes with an FPKM at or below threshold are off, genes without a value are on. The rules of
+    all reactions are evaluated for a whole chunk of samples at once (see GPRMap), and every
+    reaction whose rule is false is closed. The delta tables are the ones of
+    cell_line_variants.expression_deltas: apply them with apply_variant or write them with
+    save_variants.
+
+    model:      The base model
+    sources:    Expression tables, see expression_chunks.
+    threshold:  FPKM value at or below which a gene counts as not expressed.
+    keep:       Reactions (IDs or objects) that are never closed.
+    chunk_size: Number of samples evaluated together.
+    '''
+    rules = gpr_map(model)
+
+    keep = {getattr(rxn, 'id', rxn) for rxn in keep or []}
+    closable = np.array([rxn.id not in keep and rxn.bounds != (0.0, 0.0) for rxn in model.reactions])
+    rxnIDs = np.array(rules.reaction_ids, dtype=object)
+
+    for chunk in expression_chunks(sources, chunk_size):
+        with np.errstate(invalid='ignore'): # NaN <= threshold is False: unknown genes stay on
+            off = expression_matrix(rules, chunk) <= threshold
+        blocked = rules.blocked(off).tocsc()
+
+        for k, sample in enumerate(chunk.columns):
+            rows = blocked.indices[blocked.indptr[k]:blocked.indptr[k + 1]]
+            closed = rxnIDs[np.sort(rows[closable[rows]])]
+            yield sample, pd.DataFrame(0.0, index=pd.Index(closed, name='reaction'), columns=delta_columns)
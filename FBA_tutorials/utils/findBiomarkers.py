@@ -1,14 +1,20 @@
 import cobra
+import multiprocessing
+import numpy as np
 import pandas as pd
 from tqdm import tqdm_notebook # progress bars
 
+from .fva_cache import cached_fva
+from .gpr_map import gpr_map
+
 pd.set_option('display.max_rows', 10000) # Show everything
-pd.set_option('display.max_colwidth', -1)
+pd.set_option('display.max_colwidth', None)
 pd.set_option('expand_frame_repr', False)
 
 
 def findBiomarkers(model, fvaRxns=[], mods=[], mode='', always_unite=False, synchronous=False,
-                   eps=1.0, threshold=0.1, fracOpt=0, forceFlux=True, geneAssociationByKO=False):
+                   eps=1.0, threshold=0.1, fracOpt=0, forceFlux=True, geneAssociationByKO=False,
+                   reuseSolver=True, processes=1, useCache=False):
     '''Implements the biomarker prediction algorithm proposed in (Shlomi et al., 2009).
     It returns a pandas dataframe listing predicted biomarkers with their WT and mutant FVA
     intervals. It considers as potential biomarkers those contained in the exchange
@@ -34,9 +40,19 @@ def findBiomarkers(model, fvaRxns=[], mods=[], mode='', always_unite=False, sync
     fracOpt:                Sets the minimal percentage of the optimum of the objective function
                             to attain
     forceFlux:              BOOLEAN. Whether or not to force flux through the reaction in the
-                            healthy case.
-    geneAssociationByKO:    BOOLEAN. If true, do not use gene-reaction association in model but
-                            COBRA KO function.
+                            healthy case. The forward and the backward direction are forced in
+                            separate FVA passes, each starting from the bounds of model.
+    geneAssociationByKO:    BOOLEAN. If true, take all reactions associated with the genes in
+                            the model. If false, only the reactions the knockout of the genes
+                            blocks (evaluated with the compiled rules of gpr_map.py).
+    reuseSolver:            BOOLEAN. If true, run the WT forward, WT backward and mutant FVA passes
+                            on one warm-started LP instead of on three model copies.
+    processes:              Number of worker processes used to handle the affected reactions in
+                            the asynchronous setting. Each worker loads the model once.
+    useCache:               BOOLEAN. If true, FVA results are stored on disk and reused when the
+                            same FVA is run again (see fva_cache.py). The directory is
+                            ~/.cache/fba_tutorial_fva unless the FBA_TUTORIAL_FVA_CACHE
+                            environment variable names another one.
 
     The default settings with IEMgene/IEMrxn reproduce the approach used by Schlomi et al (2009).
     '''
@@ -47,11 +63,8 @@ def findBiomarkers(model, fvaRxns=[], mods=[], mode='', always_unite=False, sync
     ####################################
     # based on the type of objects in 'mods'
     if mode == '':
-        if all([gene in model.genes for gene in mods]):
-            mode = 'IEMgene'
-        elif all([rxn in model.reactions for rxn in mods]): # this works even for strings
-            mode = 'IEMrxn'
-        else:
+        mode = inferMode(model, mods)
+        if mode == '':
             print('Cannot identify mods input')
             return pd.DataFrame(columns=['ID', 'Name', 'Reaction', 'Prediction', 'WT',
                                          'Mutant', 'Score'])
@@ -70,11 +83,9 @@ def findBiomarkers(model, fvaRxns=[], mods=[], mode='', always_unite=False, sync
         if geneAssociationByKO:
             print("""Finding reactions associated with modifier genes using gene-reaction
                      association.""")
-            affectedRxns = [rxn for gene in geneIDs for rxn in
-                            model.genes.get_by_id(gene).reactions]
         else:
             print("Finding reactions associated with modifier genes by knockout...")
-            affectedRxns = cobra.manipulation.find_gene_knockout_reactions(model, mods)
+        affectedRxns = findAffectedRxns(model, mods, mode, geneAssociationByKO)
 
         if len(affectedRxns) == 0:
             print(('This gene list: {}, does not affect any reactions.'.format(geneIDs)))
@@ -83,11 +94,7 @@ def findBiomarkers(model, fvaRxns=[], mods=[], mode='', always_unite=False, sync
                                          'Mutant', 'Score'])
 
     elif mode == 'IEMrxn':
-        affectedRxns = mods # mods are reactions in this case
-
-        if type(affectedRxns[0]) == str: # get the reaction objects
-            # take rxn IDs in, turn into rxn objects
-            affectedRxns = [model.reactions.get_by_id(ID) for ID in affectedRxns]
+        affectedRxns = findAffectedRxns(model, mods, mode, geneAssociationByKO)
     else:
         raise ValueError(('Cannot parse mode %s. Choose from: IEMgene and IEMrxn.' % (mode)))
 
@@ -129,24 +136,42 @@ def findBiomarkers(model, fvaRxns=[], mods=[], mode='', always_unite=False, sync
     # in asynchronous setting the biomarkers need to be consolidated for each affected reaction
     if not synchronous and len(affectedRxns) > 1:
         biomarkerCount = {} # keep track of various (contradicting) predictions
-        biomarkerTable = pd.DataFrame(columns=['ID', 'Name', 'Reaction', 'Prediction', 'WT',
-                                               'Mutant', 'Score'])
+        biomarkerRows = {} # rows of the biomarkers that are currently kept
+
+        settings = {'eps': eps, 'fracOpt': fracOpt, 'mode': mode, 'forceFlux': forceFlux,
+                    'always_unite': always_unite, 'threshold': threshold,
+                    'synchronous': synchronous, 'reuseSolver': reuseSolver, 'useCache': useCache}
+
+        if processes > 1:
+            # each worker receives the model once and then handles one affected reaction per job.
+            # imap returns the sub tables in the order of affectedRxns, so the majority vote
+            # below sees them in the same order as in the serial case
+            rxnIDs = [rxn.id for rxn in affectedRxns]
+            pool = multiprocessing.Pool(processes=min(processes, len(rxnIDs)),
+                                        initializer=initBiomarkerWorker,
+                                        initargs=(model, [rxn.id for rxn in fvaRxns], settings))
+            try:
+                subTables = list(tqdm_notebook(pool.imap(biomarkerWorker, rxnIDs),
+                                               total=len(rxnIDs)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            subTables = (predictSubTable(model, [rxn], fvaRxns, **settings)
+                         for rxn in tqdm_notebook(affectedRxns)) # tqdm provides a progress bar
 
-        for rxn in tqdm_notebook(affectedRxns): # tqdm provides a progress bar
-            [WTf, WTb, mutant] = calcFluxes(model, [rxn], fvaRxns, eps, fracOpt, mode, forceFlux)
-            [WTint, mutantint] = uniteForwBack(WTf, WTb, mutant, fvaRxns, always_unite, mode)
-            if WTint == {} and mutantint == {}: # nothing to see here
+        for subTable in subTables:
+            if subTable is None: # nothing to see here
                 print('Empty wild-type and mutant FVA intervals. Skipping to next reaction.')
                 continue
 
-            [biomarkerRxns, biomarkers, score, extLvl] = predictBiomarkers(model, WTint, mutantint,
-                                                                           fvaRxns, threshold)
-            subTable = genTable(biomarkers, biomarkerRxns, score, extLvl, WTint, mutantint,
-                                threshold, synchronous, mode)
-            [biomarkerTable, biomarkerCount] = updateTable(subTable, biomarkerTable, biomarkerCount)
+            [biomarkerRows, biomarkerCount] = updateTable(subTable, biomarkerRows, biomarkerCount)
+
+        biomarkerTable = rowsToTable(biomarkerRows)
 
     else: # change all affectedRxns at once
-        [WTf, WTb, mutant] = calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux)
+        [WTf, WTb, mutant] = calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux,
+                                       reuseSolver, useCache)
         [WTint, mutantint] = uniteForwBack(WTf, WTb, mutant, fvaRxns, always_unite, mode)
         [biomarkerRxns, biomarkers, score, extLvl] = predictBiomarkers(model, WTint, mutantint,
                                                                        fvaRxns, threshold)
@@ -158,45 +183,268 @@ def findBiomarkers(model, fvaRxns=[], mods=[], mode='', always_unite=False, sync
         print(('{} low confidence biomarkers with scores below the threshold were \
                 found'.format(len(biomarkerTable[biomarkerTable.Score < threshold]))))
 
-    biomarkerTable = biomarkerTable.sort_values(by='Score', ascending=False)
-    significantBiomarkerTable = biomarkerTable[biomarkerTable.Score >= threshold]
-
-    # formatting
-    significantBiomarkerTable = significantBiomarkerTable.set_index(['ID'])
-    significantBiomarkerTable = significantBiomarkerTable[['Name', 'Prediction', 'WT',
-                                                           'Mutant', 'Score']]
+    significantBiomarkerTable = significantTable(biomarkerTable, threshold)
 
     return significantBiomarkerTable
 # end main findBiomarkers function
 
 
 
+def findBiomarkersBatch(model, fvaRxns=[], mods_list=[], mode='', always_unite=False,
+                        synchronous=False, eps=1.0, threshold=0.1, fracOpt=0, forceFlux=True,
+                        geneAssociationByKO=False, reuseSolver=True, processes=None,
+                        useCache=False):
+    '''Runs findBiomarkers for many modifier sets at once, e.g. for a screen over candidate
+    disease genes. It returns a single pandas dataframe indexed by (Gene, ID) with the same
+    columns as findBiomarkers.
+
+    The WT intervals depend only on the reactions flux is forced through, and the mutant
+    intervals only on the reactions that are blocked. Both are therefore calculated once per
+    unique set of affected reactions (one reaction at a time in the asynchronous setting, all
+    of them together in the synchronous one) and shared between all entries of mods_list that
+    affect it.
+
+    mods_list:              A list of modifiers. Every entry is either a single gene/reaction ID
+                            or a list of them, and is treated as the 'mods' of one findBiomarkers
+                            call. The 'Gene' index level holds the IDs joined with ';'.
+    processes:              Number of worker processes over which the FVAs are distributed.
+                            Defaults to the number of CPUs.
+
+    All other parameters are as in findBiomarkers and apply to every entry of mods_list.
+    '''
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if all([type(r) == str for r in fvaRxns]):
+        fvaRxns = [model.reactions.get_by_id(r) for r in fvaRxns]
+
+
+    ####################################
+    # collect the unique sets of affected reactions
+    ####################################
+    rxnSets = {} # entry label -> list of affected reaction ID tuples
+
+    mods_list = [[mods] if type(mods) == str else mods for mods in mods_list]
+
+    # evaluate the knockouts of all gene entries in one go, findAffectedRxns then finds them cached
+    if not geneAssociationByKO:
+        gpr_map(model).knockouts([mods for mods in mods_list
+                                  if (mode if mode != '' else inferMode(model, mods)) == 'IEMgene'])
+
+    for mods in mods_list:
+        label = ';'.join([getattr(mod, 'id', mod) for mod in mods])
+
+        modsMode = mode if mode != '' else inferMode(model, mods)
+        if modsMode == '':
+            print('Cannot identify mods input {}. Skipping.'.format(label))
+            continue
+
+        affectedIDs = [rxn.id for rxn in findAffectedRxns(model, mods, modsMode,
+                                                          geneAssociationByKO)]
+        if len(affectedIDs) == 0:
+            print('{} does not affect any reactions. Skipping.'.format(label))
+            continue
+
+        if not synchronous and len(affectedIDs) > 1:
+            rxnSets[label] = [(ID,) for ID in affectedIDs]
+        else:
+            rxnSets[label] = [tuple(affectedIDs)]
+
+    # in first-seen order
+    uniqueSets = list(dict.fromkeys(rxnSet for sets in rxnSets.values() for rxnSet in sets))
+
+    print('{} modifier sets affect {} unique reaction sets.'.format(len(rxnSets), len(uniqueSets)))
+
+
+    ####################################
+    # calculate the WT and mutant intervals once per unique reaction set
+    ####################################
+    settings = {'eps': eps, 'fracOpt': fracOpt, 'mode': mode, 'forceFlux': forceFlux,
+                'reuseSolver': reuseSolver, 'useCache': useCache}
+
+    if processes > 1 and len(uniqueSets) > 1:
+        pool = multiprocessing.Pool(processes=min(processes, len(uniqueSets)),
+                                    initializer=initBiomarkerWorker,
+                                    initargs=(model, [rxn.id for rxn in fvaRxns], settings))
+        try:
+            fluxes = list(tqdm_notebook(pool.imap(fluxWorker, uniqueSets),
+                                        total=len(uniqueSets)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        fluxes = [tryCalcFluxes(model, [model.reactions.get_by_id(ID) for ID in rxnSet], fvaRxns,
+                                settings)
+                  for rxnSet in tqdm_notebook(uniqueSets)]
+
+    fluxes = dict(zip(uniqueSets, fluxes))
+
+
+    ####################################
+    # predict and consolidate the biomarkers of every entry in mods_list
+    ####################################
+    tables = []
+    for label, sets in rxnSets.items():
+        biomarkerCount = {}
+        biomarkerRows = {}
+        biomarkerTable = rowsToTable(biomarkerRows)
+
+        for rxnSet in sets:
+            if isinstance(fluxes[rxnSet], str): # the FVA failed, e.g. an infeasible knockout
+                print('{}: {} (reactions {}). Skipping.'.format(label, fluxes[rxnSet],
+                                                                 ', '.join(rxnSet)))
+                continue
+
+            [WTf, WTb, mutant] = fluxes[rxnSet]
+            [WTint, mutantint] = uniteForwBack(WTf, WTb, mutant, fvaRxns, always_unite, mode)
+            if len(WTint) == 0 and len(mutantint) == 0:
+                continue
+
+            [biomarkerRxns, biomarkers, score, extLvl] = predictBiomarkers(model, WTint, mutantint,
+                                                                           fvaRxns, threshold)
+            subTable = genTable(biomarkers, biomarkerRxns, score, extLvl, WTint, mutantint,
+                                threshold, synchronous, mode)
+            if len(sets) > 1: # consolidate as in the asynchronous setting of findBiomarkers
+                [biomarkerRows, biomarkerCount] = updateTable(subTable, biomarkerRows,
+                                                              biomarkerCount)
+            else:
+                biomarkerTable = subTable
+
+        if len(sets) > 1:
+            biomarkerTable = rowsToTable(biomarkerRows)
+
+        geneTable = significantTable(biomarkerTable, threshold)
+        geneTable['Gene'] = label
+        tables.append(geneTable.reset_index())
+
+    if len(tables) == 0:
+        return pd.DataFrame(columns=['Gene', 'ID', 'Name', 'Prediction', 'WT', 'Mutant',
+                                     'Score']).set_index(['Gene', 'ID'])
+
+    return pd.concat(tables).set_index(['Gene', 'ID'])
+# end findBiomarkersBatch function
+
+
+
 ####################################
 # AUXILIARY FUNCTIONS
 ####################################
 
-def calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux):
+def inferMode(model, mods):
+    ''' Deduce the mode from the type of objects in mods. Returns '' if it cannot be deduced. '''
+    if all([gene in model.genes for gene in mods]):
+        return 'IEMgene'
+    elif all([rxn in model.reactions for rxn in mods]): # this works even for strings
+        return 'IEMrxn'
+    else:
+        return ''
+
+
+
+def findAffectedRxns(model, mods, mode, geneAssociationByKO):
+    ''' Return the reaction objects that are altered by the genes/reactions in mods. '''
+    if mode == 'IEMgene':
+        # the rules are compiled once per model and the knockouts are cached per gene set
+        rules = gpr_map(model)
+        if geneAssociationByKO:
+            return [model.reactions[j] for gene in mods
+                    for j in rules.gene_reactions[rules.gene_index[getattr(gene, 'id', gene)]].indices]
+        else:
+            return [model.reactions[j] for j in rules.knockouts([mods])[0]]
+
+    # mods are reactions in this case
+    return [model.reactions.get_by_id(rxn) if type(rxn) == str else rxn for rxn in mods]
+
+
+
+def predictSubTable(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux, always_unite,
+                    threshold, synchronous, reuseSolver, useCache):
+    ''' Run steps 1-4 of the algorithm for one set of affected reactions.
+    Returns the biomarker dataframe, or None if both the WT and mutant intervals are empty. '''
+
+    [WTf, WTb, mutant] = calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux,
+                                    reuseSolver, useCache)
+    [WTint, mutantint] = uniteForwBack(WTf, WTb, mutant, fvaRxns, always_unite, mode)
+    if len(WTint) == 0 and len(mutantint) == 0:
+        return None
+
+    [biomarkerRxns, biomarkers, score, extLvl] = predictBiomarkers(model, WTint, mutantint,
+                                                                   fvaRxns, threshold)
+    return genTable(biomarkers, biomarkerRxns, score, extLvl, WTint, mutantint,
+                    threshold, synchronous, mode)
+
+
+
+def initBiomarkerWorker(model, fvaRxnIDs, settings):
+    ''' Pool initializer. Keeps the model, the fvaRxns and the settings in the worker process so
+    that they are transferred once per worker instead of once per affected reaction. '''
+    global workerModel, workerFvaRxns, workerSettings
+
+    workerModel = model
+    workerFvaRxns = [model.reactions.get_by_id(ID) for ID in fvaRxnIDs]
+    workerSettings = settings
+
+
+
+def biomarkerWorker(rxnID):
+    ''' Pool job. Predict the biomarkers for a single affected reaction. '''
+    rxn = workerModel.reactions.get_by_id(rxnID)
+
+    return predictSubTable(workerModel, [rxn], workerFvaRxns, **workerSettings)
+
+
+
+def fluxWorker(rxnIDs):
+    ''' Pool job. Calculate the WT and mutant intervals for one set of affected reactions. '''
+    affectedRxns = [workerModel.reactions.get_by_id(ID) for ID in rxnIDs]
+
+    return tryCalcFluxes(workerModel, affectedRxns, workerFvaRxns, workerSettings)
+
+
+
+def tryCalcFluxes(model, affectedRxns, fvaRxns, settings):
+    ''' calcFluxes for findBiomarkersBatch. Returns the error message instead of raising when
+    an FVA cannot be solved, so that one infeasible knockout does not abort the whole batch. '''
+    try:
+        return calcFluxes(model, affectedRxns, fvaRxns, **settings)
+    except cobra.exceptions.OptimizationError as error:
+        return 'FVA could not be solved: {}'.format(error)
+
+
+
+def calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux, reuseSolver=True,
+               useCache=False):
     ''' Calculate both WT and mutant intervals with FVA.
-    Returns pandas dataframes.'''
+    Returns pandas dataframes.
+
+    reuseSolver:    BOOLEAN. If True, the WT forward, WT backward and mutant bounds are applied
+                    one after the other to the same LP instance inside context managers, so
+                    each FVA pass is warm-started from the basis of the previous one. If False,
+                    every pass runs on a fresh copy of the model (slow, but isolated).
+    useCache:       BOOLEAN. If True, look the FVA results up in the on-disk cache first.'''
+
+    if useCache:
+        fva = cached_fva
+    else:
+        fva = cobra.flux_analysis.flux_variability_analysis
 
 
     def calcFluxes_IEM(M, rxnlist):
         ''' Used in IEM modes. Run FVA on all exchange reactions simultaneously.
-        Calculate both WT and mutant. Returns pandas dataframes. '''
+        Calculate both WT and mutant on separate model copies. Returns pandas dataframes. '''
 
         # Healthy case (WT)
         # forward
+        M = model.copy()
 
         if forceFlux:
             # as in (Shlomi et al., 2009) force a minimal amount of flux (eps) through the
             # affected reaction(s)
-            for rxn in affectedRxns:
-                if rxn.upper_bound > 0:
-                    M.reactions.get_by_id(rxn.id).lower_bound = eps/len(affectedRxns)
+            forceForward(M, affectedRxns, eps)
 
         try:
-            WTf = cobra.flux_analysis.variability.flux_variability_analysis(M, reaction_list=rxnlist,
-                                                                            fraction_of_optimum=fracOpt)
+            WTf = fva(M, reaction_list=rxnlist, fraction_of_optimum=fracOpt)
         except:
             # sometimes doesn't work due to bounds defined above not being attainable
             print('forward FVA could not be solved. Continuing without the forward interval.')
@@ -206,13 +454,10 @@ def calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux):
         M = model.copy() # reset bounds
 
         if forceFlux: # force flux in the backward direction
-            for rxn in affectedRxns:
-                if rxn.lower_bound < 0:
-                    M.reactions.get_by_id(rxn.id).upper_bound = -eps/len(affectedRxns)
+            forceBackward(M, affectedRxns, eps)
 
         try:
-            WTb = cobra.flux_analysis.flux_variability_analysis(M, reaction_list=rxnlist,
-                                                                fraction_of_optimum=fracOpt)
+            WTb = fva(M, reaction_list=rxnlist, fraction_of_optimum=fracOpt)
         except:
             # bounds not attainable
             print('backward FVA could not be solved. Continuing without the backward interval.')
@@ -223,11 +468,44 @@ def calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux):
         M = model.copy() # reset bounds
 
         # Block all affected reactions
-        for rxn in affectedRxns:
-            M.reactions.get_by_id(rxn.id).lower_bound = M.reactions.get_by_id(rxn.id).upper_bound = 0
+        knockout(M, affectedRxns)
+
+        mutant = fva(M, reaction_list=rxnlist, fraction_of_optimum=fracOpt)
+
+        return WTf, WTb, mutant
+
+
+    def calcFluxes_IEM_reuse(M, rxnlist):
+        ''' Same as calcFluxes_IEM but without copying the model. The bounds of each pass are
+        set inside a 'with M:' block and reverted on exit, so the solver instance (and with it
+        the last optimal basis) is kept between the three FVA passes. FVA is run in this
+        process (processes=1) since worker processes would each rebuild the LP. '''
 
-        mutant = cobra.flux_analysis.flux_variability_analysis(M, reaction_list=rxnlist,
-                                                               fraction_of_optimum=fracOpt)
+        # Healthy case (WT)
+        # forward
+        with M:
+            if forceFlux:
+                forceForward(M, affectedRxns, eps)
+            try:
+                WTf = fva(M, reaction_list=rxnlist, fraction_of_optimum=fracOpt, processes=1)
+            except:
+                print('forward FVA could not be solved. Continuing without the forward interval.')
+                WTf = pd.DataFrame()
+
+        # backward
+        with M:
+            if forceFlux:
+                forceBackward(M, affectedRxns, eps)
+            try:
+                WTb = fva(M, reaction_list=rxnlist, fraction_of_optimum=fracOpt, processes=1)
+            except:
+                print('backward FVA could not be solved. Continuing without the backward interval.')
+                WTb = pd.DataFrame()
+
+        # Disease case (mutant)
+        with M:
+            knockout(M, affectedRxns)
+            mutant = fva(M, reaction_list=rxnlist, fraction_of_optimum=fracOpt, processes=1)
 
         return WTf, WTb, mutant
 
@@ -239,25 +517,57 @@ def calcFluxes(model, affectedRxns, fvaRxns, eps, fracOpt, mode, forceFlux):
 
 
     # we can run all fvaRxns at once no need to change bounds in the middle
-    with model as model:
+    if reuseSolver:
+        WTf, WTb, mutant = calcFluxes_IEM_reuse(model, fvaRxns)
+    else:
         WTf, WTb, mutant = calcFluxes_IEM(model, fvaRxns)
 
     return WTf, WTb, mutant
 
 
 
+def forceForward(M, affectedRxns, eps):
+    ''' Force eps flux, split evenly, forward through the affected reactions that allow it. '''
+    for rxn in affectedRxns:
+        rxn = M.reactions.get_by_id(rxn.id)
+        if rxn.upper_bound > 0:
+            rxn.lower_bound = eps/len(affectedRxns)
+
+
+
+def forceBackward(M, affectedRxns, eps):
+    ''' Force eps flux, split evenly, backward through the affected reactions that allow it. '''
+    for rxn in affectedRxns:
+        rxn = M.reactions.get_by_id(rxn.id)
+        if rxn.lower_bound < 0:
+            rxn.upper_bound = -eps/len(affectedRxns)
+
+
+
+def knockout(M, affectedRxns):
+    ''' Block all affected reactions. '''
+    for rxn in affectedRxns:
+        M.reactions.get_by_id(rxn.id).bounds = (0, 0)
+
+
+
 def uniteForwBack(WTf, WTb, mutant, fvaRxns, always_unite, mode):
-    '''If settings allow, unite the forward and backward WT (healthy) intervals.'''
+    '''If settings allow, unite the forward and backward WT (healthy) intervals.
+    Returns the WT and mutant intervals as dataframes with 'minimum' and 'maximum' columns,
+    indexed by the fvaRxns IDs and rounded to 3 decimals. Both are empty if no interval could
+    be calculated.'''
 
-    # take union of forward and backward healthy intervals
-    WT = pd.DataFrame(columns=WTf.columns) # init
+    rxnIDs = [rxn.id for rxn in fvaRxns]
+    cols = ['minimum', 'maximum']
 
+    # take union of forward and backward healthy intervals
     if len(WTf) != 0 and len(WTb) == 0: # no backward calculation, because FVA failed
-        WT = WTf
+        WT = WTf.loc[rxnIDs, cols].values
     elif len(WTb) != 0 and len(WTf) == 0: # no forward calculation, because FVA failed
-        WT = WTb
+        WT = WTb.loc[rxnIDs, cols].values
     elif len(WTb) == 0 and len(WTf) == 0: # no results
         print('No healthy interval could be calculated')
+        WT = None
 
     # We infer that Shlomi et al. did the above and stopped here
     # we added the always_unite setting.
@@ -265,34 +575,41 @@ def uniteForwBack(WTf, WTb, mutant, fvaRxns, always_unite, mode):
     # == 1 means, always unite forward and backward.
 
     elif always_unite and len(WTf) != 0 and len(WTb) != 0:
-        for rxn in fvaRxns: # enlarge interval with WTb if needed
-            if WTb.loc[rxn.id]["minimum"] < WTf.loc[rxn.id]["minimum"]:
-                WT.loc[rxn.id]["minimum"] = WTb.loc[rxn.id]["minimum"]
-            if WTb.loc[rxn.id]["maximum"] > WTf.loc[rxn.id]["maximum"]:
-                WT.loc[rxn.id]["maximum"] = WTb.loc[rxn.id]["maximum"]
+        # enlarge interval with WTb if needed
+        forw = WTf.loc[rxnIDs, cols].values
+        back = WTb.loc[rxnIDs, cols].values
+        WT = np.column_stack([np.where(back[:, 0] < forw[:, 0], back[:, 0], forw[:, 0]),
+                              np.where(back[:, 1] > forw[:, 1], back[:, 1], forw[:, 1])])
     elif not always_unite and len(WTf) != 0 and len(WTb) != 0:
-        for rxn in fvaRxns: # enlarge interval with WTb if needed
-            if WTf.loc[rxn.id]["minimum"] == WTf.loc[rxn.id]["maximum"] == 0:
-                WT.loc[rxn.id] = WTb.loc[rxn.id]
-            else:
-                WT.loc[rxn.id] = WTf.loc[rxn.id]
+        # take WTb where the forward interval is [0,0]
+        forw = WTf.loc[rxnIDs, cols].values
+        back = WTb.loc[rxnIDs, cols].values
+        blocked = (forw[:, 0] == forw[:, 1]) & (forw[:, 1] == 0)
+        WT = np.where(blocked[:, None], back, forw)
     else:
         print('Something weird is going on!')
         return
 
-    # Simplify dataframes to dictionaries with intervals for mutant and WT
-    WTint = {}
-    mutantint = {}
+    # Simplify dataframes to rounded intervals for mutant and WT
+    if WT is None or len(mutant) == 0:
+        return pd.DataFrame(columns=cols), pd.DataFrame(columns=cols)
 
-    if len(WT) != 0 and len(mutant) != 0:
-        for r in fvaRxns:
-            WTint[r.id] = [round(WT.loc[r.id]["minimum"], 3), round(WT.loc[r.id]["maximum"], 3)]
-            mutantint[r.id] = [ round(mutant.loc[r.id]["minimum"], 3), round(mutant.loc[r.id]["maximum"], 3)]
+    WTint = pd.DataFrame(roundFluxes(WT), index=rxnIDs, columns=cols)
+    mutantint = pd.DataFrame(roundFluxes(mutant.loc[rxnIDs, cols].values), index=rxnIDs, columns=cols)
 
     return WTint, mutantint
 
 
 
+def roundFluxes(values):
+    ''' Round an array of fluxes to 3 decimals with Python's round. np.round rounds the
+    decimal ties of the float values differently (87.2505 -> 87.25 instead of 87.251), which
+    would change intervals and predictions. '''
+    values = np.asarray(values, dtype=float)
+    return np.array([round(v, 3) for v in values.ravel().tolist()]).reshape(values.shape)
+
+
+
 def predictBiomarkers(M, WTint, mutantint, fvaRxns, threshold):
     ''' Decide if there was a signifcant interval change from WT to mutant. '''
 
@@ -304,55 +621,43 @@ def predictBiomarkers(M, WTint, mutantint, fvaRxns, threshold):
     # positive ub difference means mutant can produce less, so lower serum levels.
     # negative ub difference means mutants can produce more so higher serum levels.
 
-    score = {}
-    extLvl = {}
-    for rxn in fvaRxns:
-        # calculate score: max. percentage change from lowest to highest value
-        # (in WT/mutant) over both lower and upper bound
-        lb = [WTint[rxn.id][0], mutantint[rxn.id][0]]
-        ub = [WTint[rxn.id][1], mutantint[rxn.id][1]]
-
-        if lb == [0, 0]:
-            change_lower_bound = 0
-        else:
-            change_lower_bound = abs(max(lb)-min(lb))/max([abs(el) for el in lb])
-        if ub == [0, 0]:
-            change_upper_bound = 0
-        else:
-            change_upper_bound = abs(max(ub)-min(ub))/max([abs(el) for el in ub])
-
-        score[fvaRxns.index(rxn)] = max(change_lower_bound, change_upper_bound)
-
-        # determine direction of change 'extLvl' and save as a dictionary
-        if WTint[rxn.id][0] == mutantint[rxn.id][0] and WTint[rxn.id][1] == mutantint[rxn.id][1]:
-            extLvl[rxn.id] = "Unchanged"
-        elif WTint[rxn.id][1] < mutantint[rxn.id][0]:
-            extLvl[rxn.id] = "H.C. Elevated"
-        elif WTint[rxn.id][0] > mutantint[rxn.id][1]:
-            extLvl[rxn.id] = "H.C. Reduced"
-        elif ((WTint[rxn.id][0] <= mutantint[rxn.id][0])
-              and (WTint[rxn.id][1] <= mutantint[rxn.id][1])
-              and (max(abs(WTint[rxn.id][0] - mutantint[rxn.id][0]),
-                       abs(WTint[rxn.id][1] - mutantint[rxn.id][1])) > 0)):
-            extLvl[rxn.id] = "Elevated"
-        elif ((WTint[rxn.id][0] >= mutantint[rxn.id][0])
-              and (WTint[rxn.id][1] >= mutantint[rxn.id][1])
-              and (abs(WTint[rxn.id][0] - mutantint[rxn.id][0]) > 0
-              or abs(WTint[rxn.id][1] - mutantint[rxn.id][1]) > 0)):
-            extLvl[rxn.id] = "Reduced"
-        else:
-            extLvl[rxn.id] = "Undetermined"
+    rxnIDs = [rxn.id for rxn in fvaRxns]
+    WTlb, WTub = WTint.loc[rxnIDs, 'minimum'].values, WTint.loc[rxnIDs, 'maximum'].values
+    mutlb, mutub = mutantint.loc[rxnIDs, 'minimum'].values, mutantint.loc[rxnIDs, 'maximum'].values
+
+    # calculate score: max. percentage change from lowest to highest value
+    # (in WT/mutant) over both lower and upper bound. Zero if both values are 0.
+    diff_lower_bound = np.abs(WTlb - mutlb)
+    diff_upper_bound = np.abs(WTub - mutub)
+    max_lower_bound = np.maximum(np.abs(WTlb), np.abs(mutlb))
+    max_upper_bound = np.maximum(np.abs(WTub), np.abs(mutub))
+
+    change_lower_bound = np.divide(diff_lower_bound, max_lower_bound,
+                                   out=np.zeros(len(rxnIDs)), where=max_lower_bound != 0)
+    change_upper_bound = np.divide(diff_upper_bound, max_upper_bound,
+                                   out=np.zeros(len(rxnIDs)), where=max_upper_bound != 0)
+    score = np.maximum(change_lower_bound, change_upper_bound)
+
+    # determine direction of change 'extLvl', the first matching rule wins
+    rules = [(WTlb == mutlb) & (WTub == mutub),
+             WTub < mutlb,
+             WTlb > mutub,
+             (WTlb <= mutlb) & (WTub <= mutub) & (np.maximum(diff_lower_bound, diff_upper_bound) > 0),
+             (WTlb >= mutlb) & (WTub >= mutub) & ((diff_lower_bound > 0) | (diff_upper_bound > 0))]
+    levels = ['Unchanged', 'H.C. Elevated', 'H.C. Reduced', 'Elevated', 'Reduced']
+    extLvl = pd.Series(np.select(rules, levels, default='Undetermined'), index=rxnIDs)
 
 
     # if theshold is set to zero we should show all biomarker candidates
     # otherwise drop unchanged biomarker candidates
     if threshold > 0:
-        biomarkerRxns = [rxn for rxn in fvaRxns if extLvl[rxn.id] !=  'Unchanged']
+        keep = extLvl.values != 'Unchanged'
     else:
-        biomarkerRxns = [rxn for rxn in fvaRxns]
+        keep = np.ones(len(rxnIDs), dtype=bool)
 
     # separately return a list of scores and biomarkers
-    score = [score[fvaRxns.index(rxn)] for rxn in biomarkerRxns]
+    biomarkerRxns = [rxn for rxn, k in zip(fvaRxns, keep) if k]
+    score = score[keep].tolist()
     biomarkers = [list(rxn.metabolites.keys()) for rxn in biomarkerRxns] # this is a list of lists
     biomarkers = [item for sublist in biomarkers for item in sublist] # cleanup
 
@@ -360,33 +665,63 @@ def predictBiomarkers(M, WTint, mutantint, fvaRxns, threshold):
 
 
 
-def updateTable(subTable, biomarkerTable, biomarkerCount):
+def updateTable(subTable, biomarkerRows, biomarkerCount):
     '''Fix duplicates. Check if biomarker already exists.
     If so, check if the qualitative prediction is the same.
     If it is, keep it, if it is not delete the biomarker.
-    This leads to a majority rule scenario '''
+    This leads to a majority rule scenario.
+
+    biomarkerCount maps every biomarker ID seen so far to its signed vote count (+1 for each
+    elevated, -1 for each reduced prediction). biomarkerRows maps the biomarkers that are kept
+    to the rows with which they first entered. Both dicts are updated in place and returned;
+    use rowsToTable to turn biomarkerRows into the dataframe.'''
+
+    # group the rows of the sub table by biomarker ID in a single pass
+    subRows = {}
+    for row in subTable.to_dict('records'):
+        subRows.setdefault(row['ID'], []).append(row)
 
     for bm in subTable['ID'].tolist():
-        currentRow = subTable.loc[subTable['ID'] == bm]
+        currentRows = subRows[bm]
+        predictions = [row['Prediction'] for row in currentRows]
 
         # update the count
-        if bm not in list(biomarkerCount.keys()):
+        if bm not in biomarkerCount:
             biomarkerCount[bm] = 0
-        if ('Elevated' in currentRow['Prediction'].tolist()
-            or 'H.C. Elevated' in currentRow['Prediction'].tolist()):
+        if 'Elevated' in predictions or 'H.C. Elevated' in predictions:
             biomarkerCount[bm] += 1
-        elif ('Reduced' in currentRow['Prediction'].tolist()
-              or 'H.C. Reduced' in currentRow['Prediction'].tolist()):
+        elif 'Reduced' in predictions or 'H.C. Reduced' in predictions:
             biomarkerCount[bm] -= 1
 
         # based on the count choose to keep or drop the biomarker
-        if biomarkerCount[bm] == 0 and bm in biomarkerTable['ID'].tolist(): # equal contradictory predictions
+        if biomarkerCount[bm] == 0 and bm in biomarkerRows: # equal contradictory predictions
             print(('Removed {} because it has an equal number of contradictory predictions.'.format(bm)))
-            biomarkerTable = biomarkerTable[biomarkerTable['ID'] != bm]
-        elif biomarkerCount[bm] != 0 and bm not in biomarkerTable['ID'].tolist():
-            biomarkerTable = biomarkerTable.append(currentRow) # add new biomarker
+            del biomarkerRows[bm]
+        elif biomarkerCount[bm] != 0 and bm not in biomarkerRows:
+            biomarkerRows[bm] = currentRows # add new biomarker
+
+    return biomarkerRows, biomarkerCount
+
+
+
+def rowsToTable(biomarkerRows):
+    ''' Build the biomarker dataframe from the rows kept by updateTable, in order of entry. '''
+    return pd.DataFrame([row for rows in biomarkerRows.values() for row in rows],
+                        columns=['ID', 'Name', 'Reaction', 'Prediction', 'WT', 'Mutant', 'Score'])
+
+
 
-    return biomarkerTable, biomarkerCount
+def significantTable(biomarkerTable, threshold):
+    ''' Sort by score, drop the biomarkers below the threshold and format for the user. '''
+    biomarkerTable = biomarkerTable.sort_values(by='Score', ascending=False)
+    significantBiomarkerTable = biomarkerTable[biomarkerTable.Score >= threshold]
+
+    # formatting
+    significantBiomarkerTable = significantBiomarkerTable.set_index(['ID'])
+    significantBiomarkerTable = significantBiomarkerTable[['Name', 'Prediction', 'WT',
+                                                           'Mutant', 'Score']]
+
+    return significantBiomarkerTable
 
 
 
@@ -395,12 +730,13 @@ def genTable(biomarkers, biomarkerRxns, score, extLvl, WTint, mutantint, thresho
     '''Return the dataframe with the biomarker prediction results. '''
 
     # Generate the output pandas dataframe, return it
+    rxnIDs = [rxn.id for rxn in biomarkerRxns]
     biomarkerTable = pd.DataFrame({'ID': [bm.id for bm in biomarkers],
                                    'Name': [bm.name for bm in biomarkers],
-                                   'Reaction': [rxn.id for rxn in biomarkerRxns],
-                                   'Prediction': [extLvl[rxn.id] for rxn in biomarkerRxns],
-                                   'WT': [WTint[rxn.id] for rxn in biomarkerRxns],
-                                   'Mutant': [mutantint[rxn.id] for rxn in biomarkerRxns],
+                                   'Reaction': rxnIDs,
+                                   'Prediction': extLvl.loc[rxnIDs].tolist(),
+                                   'WT': WTint.loc[rxnIDs].values.tolist(),
+                                   'Mutant': mutantint.loc[rxnIDs].values.tolist(),
                                    'Score': score})
 
     return biomarkerTable[['ID', 'Name', 'Reaction', 'Prediction', 'WT',
@@ -3,7 +3,8 @@
 
 # In[7]:
 
-def flux_pattern(file_list, analysis = 'FBA',fraction_of_optimum=1.0):
+def flux_pattern(file_list, analysis = 'FBA',fraction_of_optimum=1.0, use_cache=False, processes=1,
+                 as_table=False):
     ''' 
 Parameters
 ----------
@@ -20,19 +21,29 @@ analysis type :
     - FVA  : Flux Variability Analisys finds the ranges of each metabolic flux at the optimum 
              (the default parameter is fraction_of_optimum=1.0, can be set to a different fraction).
 
+use_cache : if True, FVA results are stored on disk and reused when the same model is analysed
+            again (see fva_cache.py). The directory is ~/.cache/fba_tutorial_fva unless the
+            FBA_TUTORIAL_FVA_CACHE environment variable names another one. Off by default.
+
+processes : number of worker processes for FVA. The reactions of every model are split in chunks
+            and all chunks of all models share one pool. Defaults to 1, i.e. no pool.
+
+as_table : if True, return a single wide table (see flux_table_function.py) instead of the
+           dictionary.
+
 
 OUTPUT 
 ----------
     resultDict = { cell_line: DataFrame of flux pattern}
+
+    or, with as_table=True, a DataFrame with a 'subSystem' column and one flux column per cell line
    
    '''
     
-    import pandas as pd
     import cobra
     import warnings
-    from cobra.flux_analysis import flux_variability_analysis 
+    from .model_registry import get_models
     from colorama import Fore
-    import pickle
     
     # load models and save store them in a dictionary
     
@@ -44,21 +55,26 @@ OUTPUT
 #     print()
     
     # Make a Model's Dictionary
-    model_dict = {}
-    
+    # the models come from a process-wide registry: they are loaded on the first call and
+    # reused afterwards as long as the files do not change
+    model_paths = {}
+
     for model in file_list:
 
         model_name = model.replace('_FPKM.json','')
         model_name = model_name.split('/')[-1]
 
-        with open(model[:-5],'rb') as f: # strip off the .json
-            model_dict[model_name] = pickle.load(f)
-        
-        #model_dict[model_name] = cobra.io.load_json_model(model)
+        model_paths[model_name] = model[:-5] # strip off the .json
+
+    loaded_models = get_models(list(model_paths.values()))
+    model_dict = {model_name: loaded_models[path] for model_name, path in model_paths.items()}
     
     print('All models are loaded')
     print()
 
+    # reaction -> subsystem lookup of each model, used to annotate the flux patterns
+    ss_index = {m: subsystem_index(model_dict[m]) for m in model_dict}
+
 # choose which Analysis to perform
    
     print('_______________________________________________________________________________ ')
@@ -82,16 +98,9 @@ OUTPUT
             # subDataframe of reactions carrying flux
             rxns_flux = df_fluxes[df_fluxes.fluxes != 0]
 
-            # Add a new column for subsystem
-
-            rxns_flux['subSystem'] = ['']*len(rxns_flux)
-
-            # Update subsystem column, and fluxes with an absolute number
+            # Add a subsystem column, and make the fluxes absolute numbers
 
-            for rxn in rxns_flux.index:
-                ss = model_dict[m].reactions.get_by_id(rxn).subsystem
-                rxns_flux.at[rxn,'subSystem'] = ss[0]
-                rxns_flux.at[rxn,'fluxes'] = abs(rxns_flux.loc[rxn]['fluxes'])
+            rxns_flux = annotate_subsystems(rxns_flux, ss_index[m])
 
             rxns_flux = rxns_flux.sort_values('fluxes', ascending=False)
 #             print()
@@ -120,17 +129,10 @@ OUTPUT
 
             # subDataframe of reactions carrying flux
             rxns_flux = df_fluxes[df_fluxes.fluxes != 0]
-            df_fluxes = model_dict[m].optimize().fluxes.to_frame()
             
-            # Add a new column for subsystem
-
-            rxns_flux['subSystem'] = ['']*len(rxns_flux)
-            # Update subsystem column, and fluxes with an absolute number
+            # Add a subsystem column, and make the fluxes absolute numbers
 
-            for rxn in rxns_flux.index:
-                ss = model_dict[m].reactions.get_by_id(rxn).subsystem
-                rxns_flux.at[rxn,'subSystem'] = ss[0]
-                rxns_flux.at[rxn,'fluxes'] = abs(rxns_flux.loc[rxn]['fluxes'])
+            rxns_flux = annotate_subsystems(rxns_flux, ss_index[m])
 
             rxns_flux = rxns_flux.sort_values('fluxes', ascending=False)
 #             print()
@@ -147,43 +149,30 @@ OUTPUT
  #-------------------------------------------------------------------------------- 
     elif analysis == 'FVA':
                  
-        fva = cobra.flux_analysis.flux_variability_analysis
-    
     # Dictionary of flux pattern in each cell-line
         f_pattern = {}
 
-        for m in model_dict.keys():
+        # Perform FVA to compute min and flux values carried by each single rxn
+        # for all models at once on a shared worker pool
 
-            # Perform FVA to compute min and flux values carried by each single rxn
+        fva_results = fva_models(model_dict, fraction_of_optimum, use_cache, processes)
 
-            
+        for m in model_dict.keys():
 
-            df_fluxes = fva(model_dict[m], 
-                            model_dict[m].reactions, 
-                            fraction_of_optimum = fraction_of_optimum)
+            df_fluxes = fva_results[m]
 
             # I compute the max absolute value between min and max flux resulting from the FVA
 
-            maxCol=lambda x: max(x.min(), x.max(), key=abs)
-            df_fluxes['fluxes']  = df_fluxes.apply(maxCol,axis=1)
-            df_fluxes = df_fluxes.iloc[:,2:] # the third column is "abs_max_flux"
+            df_fluxes = df_fluxes[['minimum', 'maximum']].abs().max(axis=1).to_frame('fluxes')
 
 
             # subDataframe of reactions carrying flux
 
             rxns_flux = df_fluxes[df_fluxes.fluxes != 0]
             
-            # Add a new column for subsystem
+            # Add a subsystem column, and make the fluxes absolute numbers
 
-            rxns_flux['subSystem'] = ['']*len(rxns_flux)
-
-            # Update subsystem column, and fluxes with an absolute number
-
-            for rxn in rxns_flux.index:
-                ss = model_dict[m].reactions.get_by_id(rxn).subsystem
-                if len(rxns_flux.loc[rxn]['subSystem']) == 0:
-                    rxns_flux.at[rxn,'subSystem'] = ''
-                    rxns_flux.at[rxn,'fluxes'] = abs(rxns_flux.loc[rxn]['fluxes'])
+            rxns_flux = annotate_subsystems(rxns_flux, ss_index[m])
 #             print()
 #             print('Flux pattern of '+ 'cell-line ' + m + ' is ready!')
 #             print()
@@ -198,5 +187,137 @@ OUTPUT
     
     
     
+    if as_table:
+        from .flux_table_function import flux_table
+        return flux_table(f_pattern)
+
     return f_pattern
 
+
+
+def subsystem_index(model):
+    ''' 
+Return a pandas Series mapping every reaction ID of model to its (first) subsystem.
+The Recon3D cell-line models store a list of subsystems per reaction, other models a string.
+    '''
+
+    import pandas as pd
+
+    def first(ss):
+        if isinstance(ss, str):
+            return ss
+        return ss[0] if len(ss) > 0 else ''
+
+    return pd.Series({rxn.id: first(rxn.subsystem) for rxn in model.reactions}, dtype=object)
+
+
+
+def annotate_subsystems(rxns_flux, ss_index):
+    ''' 
+Return a copy of rxns_flux with a 'subSystem' column looked up in ss_index, and with the
+absolute value of the 'fluxes' column.
+    '''
+
+    rxns_flux = rxns_flux.copy()
+    rxns_flux['fluxes'] = rxns_flux['fluxes'].abs()
+    rxns_flux['subSystem'] = rxns_flux.index.map(ss_index).fillna('')
+
+    return rxns_flux
+
+
+
+def fva_models(model_dict, fraction_of_optimum=1.0, use_cache=False, processes=1):
+    '''
+Run FVA over all reactions of every model in model_dict.
+
+With processes > 1, the reactions of each model are split into chunks and the chunks of all
+models are sent to one pool of at most that many worker processes. The models of model_dict
+are passed to every worker once, when it starts, so the workers run FVA on the same models
+as processes=1 would. A progress bar per model tracks its finished reactions.
+
+With use_cache, the result of each model is looked up in and stored to the FVA cache as a
+whole (see fva_cache.py), under a key that is computed once per model in this process. The
+entries therefore do not depend on the number of processes or the chunking.
+
+OUTPUT
+----------
+    { cell_line: FVA DataFrame with minimum and maximum columns, in model reaction order }
+    '''
+
+    import cobra
+    import multiprocessing
+    import pandas as pd
+    from tqdm.auto import tqdm
+    from .fva_cache import fva_key, lookup, store
+
+    results, keys = {}, {}
+    if use_cache:
+        for m in model_dict:
+            keys[m] = fva_key(model_dict[m], [rxn.id for rxn in model_dict[m].reactions],
+                              fraction_of_optimum, {})
+            result = lookup(keys[m])
+            if result is not None:
+                results[m] = result
+
+    todo = [m for m in model_dict if m not in results]
+
+    if processes == 1:
+        for m in todo:
+            results[m] = cobra.flux_analysis.flux_variability_analysis(
+                model_dict[m], model_dict[m].reactions, fraction_of_optimum = fraction_of_optimum,
+                processes = 1)
+
+    elif len(todo) > 0:
+        # about 4 chunks per worker and model, so that the pool stays busy until the end
+        jobs = []
+        for m in todo:
+            rxn_ids = [rxn.id for rxn in model_dict[m].reactions]
+            chunk_size = max(1, -(-len(rxn_ids) // (4*processes)))
+            for start in range(0, len(rxn_ids), chunk_size):
+                jobs.append((m, start, rxn_ids[start:start + chunk_size]))
+
+        bars = {m: tqdm(total=len(model_dict[m].reactions), desc=m) for m in todo}
+        chunks = {m: [] for m in todo}
+
+        pool = multiprocessing.Pool(processes=min(processes, len(jobs)), initializer=init_fva_worker,
+                                    initargs=({m: model_dict[m] for m in todo}, fraction_of_optimum))
+        try:
+            for m, start, df in pool.imap_unordered(fva_job, jobs):
+                chunks[m].append((start, df))
+                bars[m].update(len(df))
+        finally:
+            pool.close()
+            pool.join()
+            for bar in bars.values():
+                bar.close()
+
+        # glue the chunks back together in reaction order
+        for m in todo:
+            results[m] = pd.concat([df for start, df in sorted(chunks[m], key=lambda c: c[0])])
+
+    if use_cache:
+        for m in todo:
+            store(keys[m], results[m])
+
+    return {m: results[m] for m in model_dict}
+
+
+
+def init_fva_worker(models, fraction_of_optimum):
+    ''' Pool initializer of fva_models. Keeps the models in the worker, so they are transferred
+    once per worker instead of once per chunk. '''
+    global worker_models, worker_settings
+    worker_models = models
+    worker_settings = {'fraction_of_optimum': fraction_of_optimum}
+
+
+
+def fva_job(job):
+    ''' Pool job of fva_models: FVA on one chunk of reactions of one model. '''
+    import cobra
+
+    m, start, rxn_ids = job
+    df = cobra.flux_analysis.flux_variability_analysis(
+        worker_models[m], rxn_ids, fraction_of_optimum = worker_settings['fraction_of_optimum'], processes = 1)
+
+    return m, start, df
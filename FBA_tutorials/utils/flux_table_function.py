@@ -0,0 +1,82 @@
+# coding: utf-8
+
+def flux_table(f_pattern):
+    '''
+Combine the output of flux_pattern into one wide table.
+
+Parameters
+----------
+f_pattern : { cell_line: DataFrame of flux pattern} as returned by flux_pattern
+
+OUTPUT
+----------
+    DataFrame indexed by reaction ID with a categorical 'subSystem' column and one column of
+    absolute fluxes per cell line. Reactions that carry no flux in a cell line are 0 there.
+    '''
+
+    import pandas as pd
+
+    cell_lines = list(f_pattern.keys())
+
+    table = pd.concat([f_pattern[cell_line]['fluxes'] for cell_line in cell_lines],
+                      axis=1, keys=cell_lines, sort=False).fillna(0.0)
+
+    # the subsystem of a reaction is the same in every cell line, take the first one found
+    subsystems = pd.concat([f_pattern[cell_line]['subSystem'] for cell_line in cell_lines])
+    subsystems = subsystems[~subsystems.index.duplicated()]
+
+    table.insert(0, 'subSystem', pd.Categorical(subsystems.reindex(table.index).fillna('')))
+
+    return table
+
+
+
+def subsystem_totals(table):
+    '''
+Return the total flux per subsystem (rows) and cell line (columns) of a flux table.
+    '''
+
+    cell_lines = [c for c in table.columns if c != 'subSystem']
+
+    return table.groupby('subSystem', observed=True)[cell_lines].sum()
+
+
+
+def save_flux_table(table, path):
+    '''
+Write a flux table to disk. Files ending in .parquet are written as Parquet, all others in the
+uncompressed Arrow IPC (Feather) format that load_flux_table can memory-map.
+Requires pyarrow.
+    '''
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    arrow_table = pa.Table.from_pandas(table.rename_axis('reaction'), preserve_index=True)
+
+    if path.endswith('.parquet'):
+        pq.write_table(arrow_table, path)
+    else:
+        feather.write_feather(arrow_table, path, compression='uncompressed')
+
+
+
+def load_flux_table(path, cell_lines=None):
+    '''
+Read a flux table written by save_flux_table. The file is memory-mapped, and only the
+columns of the requested cell lines (all if None) and the subsystem column are read.
+Requires pyarrow.
+    '''
+
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    columns = None if cell_lines is None else ['reaction', 'subSystem'] + list(cell_lines)
+
+    if path.endswith('.parquet'):
+        arrow_table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        arrow_table = feather.read_table(path, columns=columns, memory_map=True)
+
+    return arrow_table.to_pandas().rename_axis(None)
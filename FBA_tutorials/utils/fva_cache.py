@@ -0,0 +1,172 @@
+import cobra
+import hashlib
+import os
+from .flux_table_function import load_flux_table, save_flux_table
+
+
+# where the FVA results are stored and how much disk space they may take up. The directory can
+# also be set with the FBA_TUTORIAL_FVA_CACHE environment variable, or per call. Every entry is
+# one Parquet file, written and read like the flux tables (flux_table_function.py).
+cache_dir = os.environ.get('FBA_TUTORIAL_FVA_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'fba_tutorial_fva'))
+max_cache_size = 500 * 1024**2 # bytes
+
+# hit/miss counters of this process (pool workers keep their own)
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def cached_fva(model, reaction_list=None, fraction_of_optimum=1.0, directory=None, **kwargs):
+    ''' Drop-in replacement for cobra.flux_analysis.flux_variability_analysis that stores its
+    results on disk. The results are looked up by a hash of everything that determines them:
+    the stoichiometry, the reaction bounds, the objective, the reaction list,
+    fraction_of_optimum and the other FVA keyword arguments (except processes). Entries are
+    evicted least recently used first once the cache grows beyond max_cache_size. Requires
+    pyarrow.
+
+    model:                  A COBRApy model object
+    reaction_list:          Reactions (IDs or objects) to run FVA on. Defaults to all reactions.
+    fraction_of_optimum:    As in flux_variability_analysis.
+    directory:              The cache directory. Defaults to cache_dir.
+    kwargs:                 Passed on to flux_variability_analysis, e.g. processes or loopless.
+
+    Returns the same dataframe as flux_variability_analysis.
+    '''
+
+    if reaction_list is None:
+        reaction_list = model.reactions
+    rxnIDs = [getattr(rxn, 'id', rxn) for rxn in reaction_list]
+
+    key = fva_key(model, rxnIDs, fraction_of_optimum,
+                  {k: v for k, v in kwargs.items() if k != 'processes'})
+
+    result = lookup(key, directory)
+    if result is None:
+        result = cobra.flux_analysis.flux_variability_analysis(model, reaction_list=reaction_list,
+                                                               fraction_of_optimum=fraction_of_optimum,
+                                                               **kwargs)
+        store(key, result, directory)
+
+    return result
+
+
+
+def fva_key(model, rxnIDs, fraction_of_optimum, kwargs):
+    ''' Return the hex digest that identifies an FVA problem. '''
+    h = hashlib.sha1(stoichiometry_key(model).encode())
+
+    h.update(repr([(rxn.lower_bound, rxn.upper_bound) for rxn in model.reactions]).encode())
+    h.update(repr((model.objective.direction, str(model.objective.expression))).encode())
+    h.update(repr((rxnIDs, float(fraction_of_optimum), sorted(kwargs.items()))).encode())
+
+    return h.hexdigest()
+
+
+
+def stoichiometry_key(model):
+    ''' Return the hex digest of the reaction IDs and stoichiometry of model.
+
+    Hashing the stoichiometry is the slow part of fva_key, so the digest is kept on the model
+    and only recalculated when a reaction, metabolite or coefficient changed. That check
+    compares the objects and coefficients themselves and takes a fraction of the time. '''
+    signature = [(id(rxn), rxn.id, tuple(map(id, rxn._metabolites)), tuple(rxn._metabolites.values()))
+                 for rxn in model.reactions]
+
+    cached = getattr(model, '_stoichiometry_key', None)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    h = hashlib.sha1()
+    for rxn in model.reactions:
+        h.update(repr((rxn.id, sorted((met.id, coef) for met, coef in rxn.metabolites.items()))).encode())
+
+    model._stoichiometry_key = (signature, h.hexdigest())
+
+    return model._stoichiometry_key[1]
+
+
+
+def lookup(key, directory=None):
+    ''' Return the FVA dataframe stored under key, or None if there is none. '''
+    path = os.path.join(directory or cache_dir, key + '.parquet')
+
+    if os.path.exists(path):
+        try:
+            result = load_flux_table(path)
+        except (OSError, ValueError, KeyError):
+            pass # unreadable, e.g. evicted while reading. Recalculate.
+        else:
+            os.utime(path) # mark as recently used
+            cache_stats['hits'] += 1
+            return result
+
+    cache_stats['misses'] += 1
+    return None
+
+
+
+def store(key, result, directory=None):
+    ''' Write an FVA dataframe under key and evict old entries if needed. '''
+    directory = directory or cache_dir
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key + '.parquet')
+
+    # write then rename so readers never see half a file
+    tmp = os.path.join(directory, '{}.{}.tmp.parquet'.format(key, os.getpid()))
+    save_flux_table(result[['minimum', 'maximum']], tmp)
+    os.replace(tmp, path)
+
+    evict(directory)
+
+
+
+def evict(directory=None):
+    ''' Remove the least recently used entries until the cache fits in max_cache_size. '''
+    directory = directory or cache_dir
+    entries = []
+    for name in entry_names(directory):
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+
+    size = sum(entry[1] for entry in entries)
+    for mtime, entrySize, name in sorted(entries):
+        if size <= max_cache_size:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+        size -= entrySize
+
+
+
+def cache_info(directory=None):
+    ''' Return the hit and miss counts of this process and the number and size of the entries
+    on disk. '''
+    directory = directory or cache_dir
+    files = [os.path.join(directory, name) for name in entry_names(directory)]
+
+    return {'hits': cache_stats['hits'], 'misses': cache_stats['misses'],
+            'entries': len(files), 'size': sum(os.path.getsize(f) for f in files)}
+
+
+
+def clear_cache(directory=None):
+    ''' Remove all entries and reset the counters. '''
+    directory = directory or cache_dir
+    for name in entry_names(directory):
+        os.remove(os.path.join(directory, name))
+
+    cache_stats['hits'] = cache_stats['misses'] = 0
+
+
+
+def entry_names(directory):
+    ''' Return the file names of the entries in directory, without files still being written. '''
+    if not os.path.isdir(directory):
+        return []
+
+    return [name for name in os.listdir(directory)
+            if name.endswith('.parquet') and not name.endswith('.tmp.parquet')]
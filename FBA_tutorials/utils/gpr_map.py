@@ -0,0 +1,194 @@
+import ast
+import numpy as np
+from scipy import sparse
+
+
+class GPRMap():
+    ''' The gene reaction rules of a model compiled into one boolean circuit.
+
+    Every distinct and/or term of all rules becomes a node; terms shared between reactions are
+    stored once. The nodes are grouped into levels (genes are level 0, a term is one level
+    above its deepest operand), and each level is a sparse matrix that counts, per node, how
+    many of its operands are false. A node is false when that count reaches its threshold:
+    1 for 'and', the number of operands for 'or'. Evaluating all rules for many samples is
+    then one sparse matrix product per level, instead of a rule parse per reaction per sample.
+
+    Use gpr_map(model) to get the map of a model: it is compiled once and kept on the model.
+
+    model:      A COBRApy model object
+    max_cache:  Number of gene sets whose knockouts are remembered, see knockouts.
+    '''
+
+    def __init__(self, model, max_cache=100000):
+        self.rules = [rxn.gpr for rxn in model.reactions] # to detect changed rules, see matches
+        self.max_cache = max_cache
+        self.knockout_cache = {}
+        self.gene_ids = [gene.id for gene in model.genes]
+        self.reaction_ids = [rxn.id for rxn in model.reactions]
+        self.gene_index = {geneID: i for i, geneID in enumerate(self.gene_ids)}
+        self.reaction_index = {rxnID: j for j, rxnID in enumerate(self.reaction_ids)}
+
+        self.terms = {} # (op, operand nodes) -> node
+        self.levels = [] # per level: list of (op, operand nodes)
+        self.level_of = [0]*len(self.gene_ids)
+
+        roots = np.full(len(self.reaction_ids), -1, dtype=np.int64)
+        for j, rxn in enumerate(model.reactions):
+            if rxn.gene_reaction_rule:
+                roots[j] = self.compile(rxn.gpr.body)
+        self.roots = roots
+
+        # number the nodes level by level, so every level is a contiguous block of rows
+        nGenes = len(self.gene_ids)
+        order = list(range(nGenes))
+        for level in self.levels:
+            order.extend(self.terms[term] for term in level)
+        renumber = np.empty(len(order), dtype=np.int64)
+        renumber[order] = np.arange(len(order))
+
+        self.level_matrices, self.level_need = [], []
+        start = nGenes
+        for level in self.levels:
+            rows = np.repeat(np.arange(len(level)), [len(operands) for op, operands in level])
+            cols = renumber[[node for op, operands in level for node in operands]]
+            self.level_matrices.append(sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(level), start)))
+            self.level_need.append(np.array([1 if op == 'and' else len(operands) for op, operands in level]))
+            start += len(level)
+        self.n_nodes = start
+
+        # reaction -> node of its rule, and gene -> reactions with the gene in their rule
+        hasRule = np.flatnonzero(roots >= 0)
+        self.reaction_nodes = sparse.csr_matrix(
+            (np.ones(len(hasRule), dtype=np.int32), (hasRule, renumber[roots[hasRule]])),
+            shape=(len(self.reaction_ids), self.n_nodes))
+
+        rows, cols = [], []
+        for j, rxn in enumerate(model.reactions):
+            for gene in rxn.genes:
+                rows.append(self.gene_index[gene.id])
+                cols.append(j)
+        self.gene_reactions = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                                                shape=(len(self.gene_ids), len(self.reaction_ids)))
+
+        del self.terms, self.levels, self.level_of
+
+    def __getstate__(self):
+        # reactions pickle their rule as a string, so rule objects would not match after loading
+        state = self.__dict__.copy()
+        state['rules'] = [str(rule) for rule in self.rules]
+        return state
+
+    def matches(self, model):
+        ''' Whether the map is still valid for model: same reactions, genes and rule objects.
+        Setting a gene_reaction_rule creates a new rule object, so an identity check suffices. '''
+        if len(model.reactions) != len(self.rules) or len(model.genes) != len(self.gene_ids):
+            return False
+
+        if self.rules and isinstance(self.rules[0], str): # unpickled: compare the rules once
+            if self.rules != [str(rxn.gpr) for rxn in model.reactions]:
+                return False
+            self.rules = [rxn.gpr for rxn in model.reactions]
+
+        return all(rule is rxn.gpr for rule, rxn in zip(self.rules, model.reactions))
+
+    def compile(self, node):
+        ''' Add the term of an ast node to the circuit and return its node number. '''
+        if isinstance(node, ast.Name):
+            return self.gene_index[node.id]
+        if not isinstance(node, ast.BoolOp):
+            raise ValueError('Cannot compile gene reaction rule element {}.'.format(ast.dump(node)))
+
+        op = 'and' if isinstance(node.op, ast.And) else 'or'
+
+        # flatten nested terms with the same operator, (a and (b and c)) -> and(a, b, c)
+        operands = set()
+        for value in node.values:
+            if isinstance(value, ast.BoolOp) and isinstance(value.op, type(node.op)):
+                operands.update(self.compile(v) for v in value.values)
+            else:
+                operands.add(self.compile(value))
+        if len(operands) == 1:
+            return operands.pop()
+
+        term = (op, tuple(sorted(operands)))
+        if term not in self.terms:
+            level = 1 + max(self.level_of[i] for i in term[1])
+            if level > len(self.levels):
+                self.levels.append([])
+            self.levels[level - 1].append(term)
+            self.terms[term] = len(self.level_of)
+            self.level_of.append(level)
+
+        return self.terms[term]
+
+    def blocked(self, off):
+        ''' Return the reactions whose rule is false, for many samples at once.
+
+        off:    Boolean matrix (genes x samples, dense or scipy.sparse) that is True where a
+                gene is off, with the genes in the order of gene_ids.
+
+        Returns a boolean scipy.sparse CSR matrix (reactions x samples), in the order of
+        reaction_ids. Reactions without a rule are never blocked.
+        '''
+        false = sparse.csr_matrix(off, dtype=np.int32)
+        if false.shape[0] != len(self.gene_ids):
+            raise ValueError('off has {} rows, the model has {} genes.'.format(false.shape[0], len(self.gene_ids)))
+
+        for matrix, need in zip(self.level_matrices, self.level_need):
+            counts = (matrix @ false).tocoo()
+            keep = counts.data >= need[counts.row]
+            level = sparse.csr_matrix((np.ones(keep.sum(), dtype=np.int32), (counts.row[keep], counts.col[keep])),
+                                      shape=counts.shape)
+            false = sparse.vstack([false, level], format='csr')
+
+        return (self.reaction_nodes @ false).astype(bool)
+
+    def knockouts(self, gene_sets):
+        ''' Return the reactions knocked out by each gene set, as tuples of reaction indices in
+        model order: the reactions whose rule is false when all genes of the set are off, as
+        cobra.manipulation.knock_out_model_genes would find them.
+
+        All gene sets that were not seen before are evaluated together in one blocked() call.
+        The results are cached per set, so a gene set that comes back is free.
+
+        gene_sets:  A list of gene sets, each a list of gene IDs or Gene objects.
+        '''
+        keys = [frozenset(getattr(gene, 'id', gene) for gene in genes) for genes in gene_sets]
+        found = {key: self.knockout_cache[key] for key in keys if key in self.knockout_cache}
+        new = [key for key in dict.fromkeys(keys) if key not in found]
+
+        if new:
+            rows = [self.gene_index[geneID] for key in new for geneID in key]
+            cols = np.repeat(np.arange(len(new)), [len(key) for key in new])
+            off = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                                    shape=(len(self.gene_ids), len(new)))
+            blocked = self.blocked(off).tocsc()
+            blocked.sort_indices()
+
+            for k, key in enumerate(new):
+                found[key] = tuple(blocked.indices[blocked.indptr[k]:blocked.indptr[k + 1]].tolist())
+
+            if len(self.knockout_cache) + len(new) > self.max_cache:
+                self.knockout_cache.clear()
+            self.knockout_cache.update((key, found[key]) for key in new)
+
+        return [found[key] for key in keys]
+
+    def reactions_of(self, genes):
+        ''' Return the indices of the reactions that have any of genes (IDs) in their rule. '''
+        rows = [self.gene_index[geneID] for geneID in genes]
+        return np.unique(self.gene_reactions[rows].indices)
+
+
+
+def gpr_map(model):
+    ''' Return the GPRMap of model. It is compiled on first use and kept on the model (also
+    when the model is pickled to worker processes), and compiled again once the reactions,
+    genes or rules of the model changed. '''
+    cached = getattr(model, '_gpr_map', None)
+    if cached is None or not cached.matches(model):
+        cached = GPRMap(model)
+        model._gpr_map = cached
+
+    return cached
@@ -0,0 +1,61 @@
+import cobra
+import os
+import pickle
+import threading
+from .model_store import load_model_store, store_suffix
+
+
+# process-wide registry of loaded models: file path -> (mtime, model)
+registry = {}
+registry_lock = threading.Lock()
+
+
+def get_models(paths):
+    ''' Return a dictionary {path: model} for the model files in paths.
+
+    Models are loaded on first use and kept in a process-wide registry, so later calls return
+    the same objects without reading the files again. A model is reloaded when the
+    modification time of its file changed. Files are loaded one after the other: parsing and
+    building a COBRApy model hold the GIL, so threads would not speed this up. For large
+    models, convert them to model stores once (see model_store.py), which load much faster.
+
+    The returned models are shared between callers: change them only inside a 'with model:'
+    block, or work on a model.copy().
+
+    paths:      list of file paths. Files ending in .json are read with cobra.io.load_json_model,
+                model stores (.npmodel, see model_store.py) with load_model_store, all others
+                are unpickled.
+    '''
+
+    mtimes = {path: os.path.getmtime(path) for path in paths}
+
+    with registry_lock:
+        stale = [path for path in mtimes
+                 if path not in registry or registry[path][0] != mtimes[path]]
+
+    for path in stale:
+        model = load_model(path)
+        with registry_lock:
+            registry[path] = (mtimes[path], model)
+
+    with registry_lock:
+        return {path: registry[path][1] for path in paths}
+
+
+
+def load_model(path):
+    ''' Load a single model file. '''
+    if path.endswith('.json'):
+        return cobra.io.load_json_model(path)
+    if path.rstrip(os.sep).endswith(store_suffix):
+        return load_model_store(path)
+
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+
+def clear_registry():
+    ''' Forget all loaded models. '''
+    with registry_lock:
+        registry.clear()
@@ -0,0 +1,278 @@
+import cobra
+import json
+import math
+import numpy as np
+import os
+import pickle
+import shutil
+from cobra.core.gene import GPR
+
+
+# a model store is a directory with this suffix
+store_suffix = '.npmodel'
+store_version = 1
+
+
+def save_model_store(model, path):
+    ''' Write a model as a model store: a directory of .npy arrays that can be memory-mapped,
+    plus two small JSON files.
+
+    The stoichiometric matrix is stored in compressed sparse column form (one column per
+    reaction), next to the bounds, objective coefficients, GPR rules, subsystems and the
+    reaction, metabolite and gene IDs, names and properties. Annotations and notes go into
+    annotations.json, which load_model_store only reads when asked to.
+
+    model:  A COBRApy model object
+    path:   The directory to write. An existing store at this path is replaced.
+    '''
+
+    tmp = path.rstrip(os.sep) + '.{}.tmp'.format(os.getpid())
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    rxns, mets, genes = model.reactions, model.metabolites, model.genes
+    metIndex = {met.id: i for i, met in enumerate(mets)}
+
+    # stoichiometry, one column per reaction
+    indptr = np.zeros(len(rxns) + 1, dtype=np.int64)
+    rows, coefs = [], []
+    for j, rxn in enumerate(rxns):
+        for met, coef in rxn.metabolites.items():
+            rows.append(metIndex[met.id])
+            coefs.append(coef)
+        indptr[j + 1] = len(rows)
+
+    subsystems = [rxn.subsystem for rxn in rxns]
+    subsystemJSON = any(not isinstance(ss, str) for ss in subsystems) # e.g. lists in the cell line models
+    if subsystemJSON:
+        subsystems = [json.dumps(ss) for ss in subsystems]
+
+    arrays = {
+        'S_indptr': indptr,
+        'S_indices': np.array(rows, dtype=np.int32),
+        'S_data': np.array(coefs, dtype=np.float64),
+        'lower_bound': np.array([rxn.lower_bound for rxn in rxns], dtype=np.float64),
+        'upper_bound': np.array([rxn.upper_bound for rxn in rxns], dtype=np.float64),
+        'objective_coefficient': np.array([rxn.objective_coefficient for rxn in rxns], dtype=np.float64),
+        'charge': np.array([np.nan if met.charge is None else met.charge for met in mets], dtype=np.float64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, name + '.npy'), array)
+
+    strings = {
+        'reaction_id': [rxn.id for rxn in rxns],
+        'reaction_name': [rxn.name or '' for rxn in rxns],
+        'subsystem': [ss or '' for ss in subsystems],
+        'gene_reaction_rule': [rxn.gene_reaction_rule for rxn in rxns],
+        'metabolite_id': [met.id for met in mets],
+        'metabolite_name': [met.name or '' for met in mets],
+        'compartment': [met.compartment or '' for met in mets],
+        'formula': [met.formula or '' for met in mets],
+        'gene_id': [gene.id for gene in genes],
+        'gene_name': [gene.name or '' for gene in genes],
+    }
+    for name, values in strings.items():
+        save_strings(os.path.join(tmp, name + '.npy'), values)
+
+    header = {'version': store_version, 'id': model.id, 'name': model.name,
+              'compartments': model.compartments, 'objective_direction': model.objective.direction,
+              'reactions': len(rxns), 'metabolites': len(mets), 'genes': len(genes),
+              'subsystem_json': subsystemJSON}
+    with open(os.path.join(tmp, 'header.json'), 'w') as f:
+        json.dump(header, f)
+
+    annotations = {'model': {'annotation': model.annotation, 'notes': model.notes}}
+    for key, objects in [('reactions', rxns), ('metabolites', mets), ('genes', genes)]:
+        annotations[key] = {obj.id: {'annotation': obj.annotation, 'notes': obj.notes}
+                            for obj in objects if obj.annotation or obj.notes}
+    with open(os.path.join(tmp, 'annotations.json'), 'w') as f:
+        json.dump(annotations, f)
+
+    # swap the new store in
+    old = path.rstrip(os.sep) + '.{}.old'.format(os.getpid())
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    if os.path.exists(old):
+        shutil.rmtree(old)
+
+
+
+def save_strings(path, values):
+    ''' Store a list of strings as one NUL separated utf-8 byte array. '''
+    np.save(path, np.frombuffer('\0'.join(values).encode('utf-8'), dtype=np.uint8))
+
+
+
+def load_strings(path, n):
+    ''' Read n strings written by save_strings. '''
+    if n == 0:
+        return []
+    return np.load(path).tobytes().decode('utf-8').split('\0')
+
+
+
+class StoredModel():
+    ''' Read access to a model store without building a COBRApy model.
+
+    The numeric arrays are memory-mapped and the string columns are only decoded when they
+    are first used, so opening a store is nearly free. Use S, the bound arrays and the ID
+    lists for array computations, and to_model() for a solver-ready COBRApy model.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as f:
+            self.header = json.load(f)
+        if self.header['version'] != store_version:
+            raise ValueError('{} has model store version {}, expected {}.'.format(
+                path, self.header['version'], store_version))
+        self.strings = {}
+
+    def array(self, name):
+        ''' Return a numeric column, memory-mapped. '''
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def string_list(self, name, n):
+        ''' Return a string column, decoded on first use. '''
+        if name not in self.strings:
+            self.strings[name] = load_strings(os.path.join(self.path, name + '.npy'), n)
+        return self.strings[name]
+
+    @property
+    def reaction_ids(self):
+        return self.string_list('reaction_id', self.header['reactions'])
+
+    @property
+    def metabolite_ids(self):
+        return self.string_list('metabolite_id', self.header['metabolites'])
+
+    @property
+    def gene_ids(self):
+        return self.string_list('gene_id', self.header['genes'])
+
+    @property
+    def lower_bounds(self):
+        return self.array('lower_bound')
+
+    @property
+    def upper_bounds(self):
+        return self.array('upper_bound')
+
+    @property
+    def S(self):
+        ''' The stoichiometric matrix as a scipy.sparse CSC matrix (metabolites x reactions). '''
+        from scipy.sparse import csc_matrix
+        return csc_matrix((self.array('S_data'), self.array('S_indices'), self.array('S_indptr')),
+                          shape=(self.header['metabolites'], self.header['reactions']))
+
+    def to_model(self, annotations=True):
+        ''' Build a COBRApy model from the store.
+
+        annotations:    Also read the annotations and notes. Skip them for a faster load when
+                        they are not needed.
+        '''
+        h = self.header
+        nRxns, nMets, nGenes = h['reactions'], h['metabolites'], h['genes']
+
+        model = cobra.Model(h['id'], name=h['name'])
+        model.compartments = h['compartments']
+
+        # genes first, so that the GPRs below link to them
+        genes = [cobra.Gene(geneID, name=name) for geneID, name
+                 in zip(self.gene_ids, self.string_list('gene_name', nGenes))]
+        for gene in genes:
+            gene._model = model
+        model.genes.extend(genes)
+
+        charges = np.asarray(self.array('charge'))
+        mets = [cobra.Metabolite(metID, formula=formula, name=name,
+                                 charge=None if math.isnan(charge) else (int(charge) if charge.is_integer() else charge),
+                                 compartment=compartment)
+                for metID, formula, name, charge, compartment
+                in zip(self.metabolite_ids, self.string_list('formula', nMets),
+                       self.string_list('metabolite_name', nMets), charges.tolist(),
+                       self.string_list('compartment', nMets))]
+        model.add_metabolites(mets)
+
+        subsystems = self.string_list('subsystem', nRxns)
+        if h['subsystem_json']:
+            subsystems = [json.loads(ss) for ss in subsystems]
+
+        indptr = np.asarray(self.array('S_indptr')).tolist()
+        indices = np.asarray(self.array('S_indices')).tolist()
+        data = np.asarray(self.array('S_data')).tolist()
+
+        parsed = {} # rule -> pickled GPR: every rule is parsed once, unpickling is a fast copy
+        rxns = []
+        for j, (rxnID, name, subsystem, lb, ub, rule) in enumerate(zip(
+                self.reaction_ids, self.string_list('reaction_name', nRxns), subsystems,
+                np.asarray(self.lower_bounds).tolist(), np.asarray(self.upper_bounds).tolist(),
+                self.string_list('gene_reaction_rule', nRxns))):
+            rxn = cobra.Reaction(rxnID, name=name, subsystem=subsystem, lower_bound=lb, upper_bound=ub)
+
+            # the metabolites are already in the model: set them directly instead of through
+            # add_metabolites, which copies every metabolite that is not yet in a model
+            rxn._metabolites = {mets[i]: coef for i, coef in
+                                zip(indices[indptr[j]:indptr[j + 1]], data[indptr[j]:indptr[j + 1]])}
+
+            if rule:
+                if rule not in parsed:
+                    parsed[rule] = pickle.dumps(GPR.from_string(rule))
+                rxn._gpr = pickle.loads(parsed[rule])
+
+            rxns.append(rxn)
+
+        model.add_reactions(rxns)
+
+        objective = np.asarray(self.array('objective_coefficient'))
+        cobra.util.solver.set_objective(model, {rxns[j]: objective[j] for j in np.flatnonzero(objective)})
+        model.objective.direction = h['objective_direction']
+
+        if annotations:
+            with open(os.path.join(self.path, 'annotations.json')) as f:
+                info = json.load(f)
+            model.annotation = info['model']['annotation']
+            model.notes = info['model']['notes']
+            for key, objects in [('reactions', model.reactions), ('metabolites', model.metabolites),
+                                 ('genes', model.genes)]:
+                for objID, entry in info[key].items():
+                    obj = objects.get_by_id(objID)
+                    obj.annotation = entry['annotation']
+                    obj.notes = entry['notes']
+
+        return model
+
+
+
+def load_model_store(path, annotations=True):
+    ''' Load a model store written by save_model_store as a solver-ready COBRApy model. '''
+    return StoredModel(path).to_model(annotations=annotations)
+
+
+
+def convert_model(source, path=None):
+    ''' Convert a model file to a model store and return the path of the store.
+
+    source: A .json, .mat or .xml (SBML) model file, or a pickled model (any other name, like
+            the cell line models).
+    path:   The store to write. Defaults to source with its extension replaced by .npmodel.
+    '''
+    root, ext = os.path.splitext(source)
+    if path is None:
+        path = (root if ext in ('.json', '.mat', '.xml', '.sbml') else source) + store_suffix
+
+    if ext == '.json':
+        model = cobra.io.load_json_model(source)
+    elif ext == '.mat':
+        model = cobra.io.load_matlab_model(source)
+    elif ext in ('.xml', '.sbml'):
+        model = cobra.io.read_sbml_model(source)
+    else:
+        with open(source, 'rb') as f:
+            model = pickle.load(f)
+
+    save_model_store(model, path)
+
+    return path
@@ -11,11 +11,10 @@ brownian() implements one dimensional Brownian motion (i.e. the Wiener process).
 # File: brownian.py
 
 from math import sqrt
-from scipy.stats import norm
 import numpy as np
 
 
-def brownian(x0, n, dt, delta, out=None):
+def brownian(x0, n, dt, delta, out=None, rng=None, chunk_size=None):
     """
     Generate an instance of Brownian motion (i.e. the Wiener process):
 
@@ -52,6 +51,17 @@ def brownian(x0, n, dt, delta, out=None):
     out : numpy array or None
         If `out` is not None, it specifies the array in which to put the
         result.  If `out` is None, a new numpy array is created and returned.
+    rng : numpy Generator, int, SeedSequence or None
+        The random number generator, or a seed for `numpy.random.default_rng`.
+        The same seed gives the same path. None uses fresh entropy.
+    chunk_size : int or None
+        If given, the motion is generated `chunk_size` steps at a time (see
+        `brownian_chunks`) and written into `out`, so the memory used besides
+        `out` is bounded by the chunk.  With `out` a `numpy.memmap`, e.g. from
+        `brownian_to_file`, the ensemble can be larger than the memory.  For an
+        array `x0` the random numbers are drawn in a different order, so the
+        same seed gives different (equally distributed) paths than without
+        `chunk_size`.
 
     Returns
     -------
@@ -62,13 +72,26 @@ def brownian(x0, n, dt, delta, out=None):
 
     x0 = np.asarray(x0)
 
+    if chunk_size is not None:
+        if out is None:
+            out = np.empty(x0.shape + (n,))
+
+        start = 0
+        for block in brownian_chunks(x0, n, dt, delta, chunk_size, rng):
+            out[..., start:start + block.shape[-1]] = block
+            start += block.shape[-1]
+
+        return out
+
     # For each element of x0, generate a sample of n numbers from a
     # normal distribution.
-    r = norm.rvs(size=x0.shape + (n,), scale=delta*sqrt(dt))
+    rng = np.random.default_rng(rng)
+    r = rng.normal(size=x0.shape + (n,), scale=delta*sqrt(dt))
 
-    # If `out` was not given, create an output array.
+    # If `out` was not given, sum in place instead of creating a second
+    # array of the same size.
     if out is None:
-        out = np.empty(r.shape)
+        out = r
 
     # This computes the Brownian motion by forming the cumulative sum of
     # the random samples. 
@@ -79,3 +102,50 @@ def brownian(x0, n, dt, delta, out=None):
 
     return out
 
+
+
+def brownian_chunks(x0, n, dt, delta, chunk_size=1024, rng=None):
+    """
+    Generate Brownian motion as `brownian` does, in blocks of at most
+    `chunk_size` steps.  The running position at the end of each block is
+    the starting point of the next, so only one block is in memory at a time.
+
+    For a scalar `x0` the blocks make up the same path as `brownian` with the
+    same seed.  For an array `x0` each block draws the steps of all paths at
+    once, whereas `brownian` draws each path in full before the next one: the
+    paths have the same distribution, but not the same values.
+
+    Yields numpy arrays of shape `x0.shape + (m,)`, with m <= chunk_size,
+    that together make up the n steps.
+    """
+
+    x0 = np.asarray(x0)
+    rng = np.random.default_rng(rng)
+
+    position = x0.astype(float)
+    for start in range(0, n, chunk_size):
+        block = rng.normal(size=x0.shape + (min(chunk_size, n - start),), scale=delta*sqrt(dt))
+
+        np.cumsum(block, axis=-1, out=block)
+        block += np.expand_dims(position, axis=-1)
+        position = block[..., -1].copy()
+
+        yield block
+
+
+def brownian_to_file(filename, x0, n, dt, delta, chunk_size=1024, rng=None):
+    """
+    Write the Brownian motion of `brownian_chunks` to the .npy file
+    `filename`, chunk by chunk, and return it as a read-only memory-mapped
+    array.
+    Load it again later with `numpy.load(filename, mmap_mode='r')`.
+    """
+
+    x0 = np.asarray(x0)
+
+    out = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=x0.shape + (n,))
+    brownian(x0, n, dt, delta, out=out, rng=rng, chunk_size=chunk_size)
+    out.flush()
+    del out
+
+    return np.load(filename, mmap_mode='r')
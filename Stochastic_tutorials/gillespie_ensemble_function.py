@@ -3,18 +3,185 @@
 
 # In[72]:
 
-def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0 ):
+def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0, engine = 'numpy', full_output = False, rng = None):
+    """
+    Simulate an ensemble of N_CELLS cells with bursty transcription and first order mRNA
+    degradation until the Fano factor of the mRNA distribution converges.
+
+    Each round the 25% of cells that lag behind the most in simulated time take one Gillespie
+    step. Every 10 rounds the mRNA content of all cells is read at the time of the slowest
+    cell; once the Fano factor of that distribution changes by less than 1% compared to the
+    previous 4 readings the simulation stops.
+
+    Arguments
+    ---------
+    engine : 'numpy' (default) keeps the state of all cells in arrays and updates the selected
+             cells together. 'cells' is the original implementation with one CELL object per
+             cell, stepped one at a time.
+    full_output : bool
+        If True, also return a dictionary describing the last reading.
+    rng : a numpy Generator, or a seed for one (int or SeedSequence). The same seed gives the
+          same result. None uses fresh entropy.
+
+    Returns
+    -------
+    A list with the steady-state mRNA content of every cell.
+    With full_output, a tuple (list, info) where info has the keys 'fano', 'mean', 'variance'
+    of the distribution, 'time' (the simulated time it was read at), 'rounds' and 'converged'.
+    """
+
+    if engine == 'numpy':
+        return gillespie_ensemble_numpy(N_CELLS, k_burst, k_deg, burst_size, full_output, rng)
+    elif engine == 'cells':
+        return gillespie_ensemble_cells(N_CELLS, k_burst, k_deg, burst_size, full_output, rng)
+    else:
+        raise ValueError("Unknown engine {}. Choose from: 'numpy' and 'cells'.".format(engine))
+
+
+
+def gillespie_ensemble_numpy(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0, full_output = False, rng = None):
+    
+    # IMPORT stuff
+    import numpy as np
+    from collections import deque
+    from propensity_function import MassAction
+    from moments_function import Moments
+
+    # ---------------------------------------------------------- #
+
+    N_RUNS = 16000
+
+    perc_cells_to_update = 0.25
+
+    CHECK_EVERY = 10 # rounds between two readings of the distribution
+
+    # LIST OF TOLERANCES
+    tol_f = 0.01 # tol% change in Fano means convergence
+
+    deg_size = 1.0
+
+    van_Kampen_Fano_factor = (deg_size + burst_size)/(deg_size*2+0.00)
+    macroscopic_mean = (k_burst*burst_size)/((k_deg*deg_size)+0.00)
+
+    deg_propensity = MassAction(k_deg, [deg_size]) # k_deg*n!/(n-deg_size)!
+
+    # ---------------------------------------------------------- #
+
+    # INITIAL mRNA content: around the macroscopic mean, as in the CELL implementation
+
+    rng = np.random.default_rng(rng)
+
+    random_m = rng.uniform(0.8, 1.2, N_CELLS)*macroscopic_mean
+    random_std = rng.uniform(0.8, 1.2, N_CELLS)*round(np.sqrt(macroscopic_mean*van_Kampen_Fano_factor), 2)
+    cell_status = np.maximum(np.trunc(rng.normal(loc=random_m, scale=random_std)), 0)
+
+    last_time_point = np.zeros(N_CELLS)
+
+    # TRAJECTORIES: one row per cell with the (time, mRNA) points that were not read yet.
+    # Unused slots have time +inf; 'filled' is the number of used slots of each row.
+    width = 2*CHECK_EVERY
+    traj_time = np.full((N_CELLS, width), np.inf)
+    traj_mrna = np.zeros((N_CELLS, width))
+    traj_time[:, 0] = 0
+    traj_mrna[:, 0] = cell_status
+    filled = np.ones(N_CELLS, dtype=int)
+
+    rows = np.arange(N_CELLS)
+    n_slow = max(1, int(round(perc_cells_to_update*N_CELLS))) # at least one cell per round
+
+    fano_factor_list = deque(maxlen=6) # the convergence test needs the last 6 readings
+    converged = False
+
+    # ---------------------------------------------------------- #
+
+    for time in range(N_RUNS):
+
+        if time != 0:
+            slow_cells = np.argpartition(last_time_point, n_slow - 1)[:n_slow]
+        else:
+            slow_cells = rows
+
+        # PROPENSITIES of the selected cells
+
+        n = cell_status[slow_cells]
+        Propensity_deg = deg_propensity.array(n)
+
+        SUM_propensities = k_burst + Propensity_deg
+        P_deg = Propensity_deg/SUM_propensities
+        P_burst = k_burst/SUM_propensities
+
+        # determine step-size in time (first RANDOM number) and the event (second RANDOM number)
+
+        new_time = last_time_point[slow_cells] + rng.standard_exponential(len(slow_cells))/SUM_propensities
+        r = rng.random(len(slow_cells))
+
+        burst = r <= P_burst
+        degradation = ~burst & (r > 1.0 - P_deg)
+        n = n + burst*burst_size - degradation*deg_size
+
+        last_time_point[slow_cells] = new_time
+        cell_status[slow_cells] = n
+
+        # store the new points, growing the trajectory table when a row is full
+
+        if filled[slow_cells].max() >= width:
+            traj_time = np.hstack([traj_time, np.full((N_CELLS, width), np.inf)])
+            traj_mrna = np.hstack([traj_mrna, np.zeros((N_CELLS, width))])
+            width *= 2
+
+        traj_time[slow_cells, filled[slow_cells]] = new_time
+        traj_mrna[slow_cells, filled[slow_cells]] = n
+        filled[slow_cells] += 1
+
+
+        if time != 0 and time%CHECK_EVERY == 0:
+
+            # read every cell at the simulated time of the slowest cell
+            min_time = last_time_point.min()
+
+            on_left = (traj_time <= min_time).sum(axis=1) - 1 # last point on the left of min_time
+            distribution_left = traj_mrna[rows, on_left]
+
+            # drop the points before that one, they will not be read again
+            keep = on_left[:, None] + np.arange(width)
+            outside = keep >= width
+            keep = np.minimum(keep, width - 1)
+            traj_time = np.where(outside, np.inf, np.take_along_axis(traj_time, keep, axis=1))
+            traj_mrna = np.take_along_axis(traj_mrna, keep, axis=1)
+            filled -= on_left
+
+            moments = Moments().update_array(distribution_left)
+            f = moments.fano
+
+            fano_factor_list.append(f)
+
+            if len(fano_factor_list) > 5 and fano_converged(fano_factor_list, tol_f):
+                converged = True
+                break
+
+    if not converged:
+        print('The Fano factor did not converge within {} rounds, returning the last distribution.'.format(N_RUNS))
+
+    ss_distr = [int(x) for x in distribution_left]
+
+    if full_output:
+        return ss_distr, {'fano': moments.fano, 'mean': moments.mean, 'variance': moments.variance,
+                          'time': min_time, 'rounds': time + 1, 'converged': converged}
+
+    return ss_distr
+
+
+
+def gillespie_ensemble_cells(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0, full_output = False, rng = None):
     
     # IMPORT stuff
-    import random # 'random' is a module to generate random variables
-    import matplotlib.pyplot as plt # package to make plot
-    get_ipython().magic(u'matplotlib inline')
     import numpy as np 
-    import pickle
-    import math 
-    import scipy.stats.stats as st
-    import pandas as pd
-    import operator
+    from collections import deque
+    import heapq
+    from trajectory_function import Trajectory
+    from propensity_function import MassAction
+    from moments_function import Moments
+    from random_blocks_function import RandomBlocks
     
     # DEFINE A CLASS "CELL" WITH THE FOLLOWING FEATURES
     class CELL:
@@ -28,7 +195,8 @@ def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size =
             self.deg_size = deg_size
             self.burst_size = burst_size
 
-            self.trajectory = {min_time:initial_mrna}
+            self.trajectory = Trajectory()
+            self.trajectory.append(min_time, initial_mrna)
 
             self.van_Kampen_Fano_factor = ((self.deg_size + self.burst_size)/((self.deg_size)*2+0.00))
             self.macroscopic_mean = ((self.k_burst*self.burst_size)/((self.k_deg*self.deg_size)+0.00))
@@ -50,7 +218,7 @@ def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size =
        
     N_CELLS = N_CELLS
 
-    Dict_min_time_Fano_var_mean = {}
+    recent_moments = deque(maxlen=6) # (min_time, Fano, var, mean, skew, kurtosis) of the last readings
 
     min_time = 0
 
@@ -72,22 +240,32 @@ def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size =
 
     deg_size,burst_size = 1.0, burst_size
 
+    deg_propensity = MassAction(k_deg, [deg_size]) # k_deg*n!/(n-deg_size)!, the same for all cells
 
     min_time_zero = 0
     initial_mrna_zero = 0
     # ---------------------------------------------------------- #
 
 
+    # RANDOM numbers: the initial distribution in one go, the Gillespie steps from blocks
+    rng = np.random.default_rng(rng)
+    random_blocks = RandomBlocks(rng)
+
+    initial_m = rng.uniform(0.8, 1.2, N_CELLS)
+    initial_std = rng.uniform(0.8, 1.2, N_CELLS)
+    initial_z = rng.standard_normal(N_CELLS)
+
     for n in range(N_CELLS):
 
         cell_track[n] =  CELL(cell_type, k_deg, k_burst, deg_size, burst_size, min_time_zero, initial_mrna_zero)
-        random_m = (np.random.uniform(0.8,1.2))*cell_track[n].macroscopic_mean
-        random_std = (np.random.uniform(0.8,1.2))*round(np.sqrt(cell_track[n].macroscopic_mean*cell_track[n].van_Kampen_Fano_factor),2)
-        p = max([round(int(np.random.normal(loc= random_m, scale=random_std))),0])
+        random_m = initial_m[n]*cell_track[n].macroscopic_mean
+        random_std = initial_std[n]*round(np.sqrt(cell_track[n].macroscopic_mean*cell_track[n].van_Kampen_Fano_factor),2)
+        p = max([round(int(random_m + random_std*initial_z[n])),0])
     #     p = max([round(int(np.random.normal(loc= cell_track[n].macroscopic_mean, scale=round(np.sqrt(cell_track[n].macroscopic_mean*cell_track[n].van_Kampen_Fano_factor),2)))),0])
 
 
-        cell_track[n].trajectory = {0: p} # {time zero: poisson mRNA}
+        cell_track[n].trajectory = Trajectory()
+        cell_track[n].trajectory.append(0, p) # time zero: poisson mRNA
         cell_status[n] = p
         last_time_point.extend([0])
 
@@ -103,31 +281,28 @@ def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size =
 
     # LIST OF TOLERANCES
     tol_f = 0.01 # tol% hange in Fano means convergence
+    converged = False
     
     
     
     
+    # QUEUE of (simulated time, cell) pairs: the slowest cell is always on top
+    time_queue = [(last_time_point[cell], cell) for cell in range(N_CELLS)]
+    heapq.heapify(time_queue)
+
     for time in range(N_RUNS):
 
         if time != 0:
-            tmax_dict = {}
-            for cell in range(N_CELLS):
-                timepoints = sorted(cell_track[cell].trajectory.keys())
-                tmax = max(timepoints)
-                tmax_dict[cell] = tmax
-            slow_cells= [k for v,k in sorted([(v,k) for k,v in tmax_dict.items()]) ][: int(round(perc_cells_to_update*N_CELLS))]
-
+            n_slow_cells = max(1, int(round(perc_cells_to_update*N_CELLS)))
         else: 
-            slow_cells = range(N_CELLS)
+            n_slow_cells = N_CELLS
 
+        slow_cells = [heapq.heappop(time_queue)[1] for i in range(n_slow_cells)]
 
-        for index in slow_cells:
 
-            if cell_status[index] >= cell_track[index].deg_size:
-                Propensity_deg = cell_track[index].k_deg*(math.factorial(cell_status[index])/(math.factorial(cell_status[index] - cell_track[index].deg_size)))
+        for index in slow_cells:
 
-            else:
-                Propensity_deg = 0.0
+            Propensity_deg = deg_propensity(cell_status[index]) # 0 when there are fewer than deg_size molecules
 
 
             # NORMALISE the propensities such that they sum to 1
@@ -139,14 +314,14 @@ def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size =
             # determine step-size in time (first RANDOM number)
 
             lambdA = (cell_track[index].k_burst + Propensity_deg)
-            delta_time = random.expovariate(lambdA)
+            delta_time = random_blocks.exponential()/lambdA
             current_time = last_time_point[index]
             new_time = current_time + delta_time
             last_time_point[index] = new_time
 
             # pick a second RANDOM number that decides which event takes place: bursting or degradation
 
-            r = random.random()
+            r = random_blocks.uniform()
 
             if r <= P_burst: 
                 cell_status[index] = cell_status[index] + cell_track[index].burst_size
@@ -155,76 +330,69 @@ def gillespie_ensemble(N_CELLS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size =
                 cell_status[index] = cell_status[index] - cell_track[index].deg_size
 
 
-            cell_track[index].trajectory[new_time] = cell_status[index] ### HERE is where I update the cell mRNA content!!
-
-
-        # EACH RUN find the cell with the minimal simulated time
-
-        list_of_max_times = []
+            cell_track[index].trajectory.append(new_time, cell_status[index]) ### HERE is where I update the cell mRNA content!!
 
-        for i in range(N_CELLS):
-            list_of_max_times.append(max(sorted(cell_track[i].trajectory.keys())))
+            heapq.heappush(time_queue, (new_time, index))
 
-        min_time = min(list_of_max_times)
 
+        # EACH RUN find the cell with the minimal simulated time
 
-        timepoints_on_left = []
-        distribution_left = []
-        index_timepoints_on_left = []   
+        min_time = time_queue[0][0]
 
 
 
         if time != 0 and time%10 == 0:
 
-            for cell in range(N_CELLS):
-
-                timepoints = sorted(cell_track[cell].trajectory.keys())
-                timepoints_left = [i for i in timepoints if i <= min_time ] # all timepoints left of min_time
-
-                this_timepoint_on_left = np.max(timepoints_left) # the biggest timepoint on the left
-                index_timepoints_on_left.append(len(timepoints_left)) # count the number of points on the left
-                timepoints_on_left.append(this_timepoint_on_left) 
-                distribution_left.append(cell_track[cell].trajectory[timepoints_on_left[cell]])
+            distribution_left = []
+            moments = Moments()
 
+            for cell in range(N_CELLS):
 
-                [cell_track[cell].trajectory.pop(x, None) for x in timepoints[:timepoints.index(this_timepoint_on_left)] ]
+                distribution_left.append(cell_track[cell].trajectory.value_at(min_time)) # mRNA at the biggest timepoint on the left
+                moments.update(distribution_left[-1])
 
+                cell_track[cell].trajectory.drop_before(min_time)
 
-            v= np.var(distribution_left)
-            m= np.mean(distribution_left)      
-            f= v/m
-            s= st.skew(distribution_left)
-            k= st.kurtosis(distribution_left)
 
-            Dict_min_time_Fano_var_mean[min_time] = f,v,m,s,k
+            v= moments.variance
+            m= moments.mean
+            f= moments.fano
+            s= moments.skewness
+            k= moments.kurtosis
 
             # the list "distribution_left" contains the mRNA content of each cell, 
+            # only the moments of the last readings are kept
+            recent_moments.append((min_time,f,v,m,s,k))
 
-            # this two list now are in the same dictionary
-            sorted_Dict_min_time_Fano_var_mean = sorted(Dict_min_time_Fano_var_mean.items(), key= operator.itemgetter(0))
-
-            fano_factor_list = [x[1][0] for x in sorted_Dict_min_time_Fano_var_mean]
-            skewness_list = [x[1][3] for x in sorted_Dict_min_time_Fano_var_mean]
+            fano_factor_list = [x[1] for x in recent_moments]
 
 
+            if len(fano_factor_list) > 5 and fano_converged(fano_factor_list, tol_f):
+                converged = True
+                break
 
-            if len(fano_factor_list) > 5:
-                perc_fano = abs(fano_factor_list[-1] - fano_factor_list[-2])/fano_factor_list[-2]
-                perc_fano2 = abs(fano_factor_list[-1] - fano_factor_list[-3])/fano_factor_list[-3]
-                perc_fano3 = abs(fano_factor_list[-1] - fano_factor_list[-4])/fano_factor_list[-4]
-                perc_fano4 = abs(fano_factor_list[-1] - fano_factor_list[-5])/fano_factor_list[-5]
 
+    if not converged:
+        print('The Fano factor did not converge within {} rounds, returning the last distribution.'.format(N_RUNS))
 
+    ss_distr = [int(x) for x in  distribution_left] ## if you want to plot this values need to be transformed in integer
 
-                current_moments = [cell_track[0].k_deg,cell_track[0].k_burst,cell_track[0].deg_size,cell_track[0].burst_size,cell_track[0].Half_life, min_time,cell_track[0].macroscopic_mean, round(m,2),round(v,2),cell_track[0].van_Kampen_Fano_factor, round(f,2)]
-                current_table = pd.DataFrame([current_moments], columns=['k_deg','k_burst','deg_size','burst_size','Theor. Half_life','Time','Theor. MEAN','Mean', 'Variance', 'Van Kampen FF', 'Fano Factor'] )   
-                
-                if all([x <= tol_f for x in [perc_fano,perc_fano2,perc_fano3,perc_fano4]]):
+    if full_output:
+        return ss_distr, {'fano': f, 'mean': m, 'variance': v, 'time': recent_moments[-1][0],
+                          'rounds': time + 1, 'converged': converged}
 
-                    ss_distr = [int(x) for x in  distribution_left] ## if you want to plot this values need to be transformed in integer
+    return ss_distr
 
-                    break
 
 
-    return ss_distr
+def fano_converged(fano_factor_list, tol_f):
+    """
+    Whether the last Fano factor differs by at most tol_f (relative) from each of the 4
+    readings before it. The test multiplies instead of dividing by the earlier readings, so a
+    Fano factor of 0 (e.g. a single cell) counts as converged once it stays 0 instead of
+    dividing by zero.
+    """
+    fano_factor_list = list(fano_factor_list)
+    last = fano_factor_list[-1]
 
+    return all([abs(last - f) <= tol_f*abs(f) for f in fano_factor_list[-5:-1]])
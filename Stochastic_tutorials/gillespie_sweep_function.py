@@ -0,0 +1,70 @@
+# coding: utf-8
+
+def gillespie_sweep(k_burst = [50.0], k_deg = [1.0], burst_size = [1.0], N_CELLS = [1000], seed = None,
+                    processes = None, engine = 'numpy'):
+    """
+    Run gillespie_ensemble for every combination of the given parameter values, spread over
+    worker processes. Works outside of a notebook.
+
+    Every run gets its own random stream, spawned from one numpy SeedSequence. The same seed
+    therefore gives the same table, however the runs are distributed over the workers.
+
+    Arguments
+    ---------
+    k_burst, k_deg, burst_size, N_CELLS : a value or a list of values.
+    seed : int or None
+        The root seed. None draws fresh entropy; the table's 'seed' column holds the root
+        entropy and the run number, which together reproduce a single run.
+    processes : int
+        Number of worker processes. Defaults to the number of CPUs; 1 runs in this process.
+    engine : passed on to gillespie_ensemble.
+
+    Returns
+    -------
+    A pandas DataFrame with one row per parameter combination and the columns k_burst, k_deg,
+    burst_size, N_CELLS, fano, mean, variance, time (simulated time at convergence), rounds,
+    converged and seed.
+    """
+
+    import itertools
+    import multiprocessing
+    import numpy as np
+    import pandas as pd
+
+    grid = list(itertools.product(*[np.atleast_1d(values).tolist()
+                                    for values in [k_burst, k_deg, burst_size, N_CELLS]]))
+
+    root = np.random.SeedSequence(seed)
+    jobs = [(params, child, engine) for params, child in zip(grid, root.spawn(len(grid)))]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            rows = list(pool.imap(sweep_job, jobs))
+    else:
+        rows = [sweep_job(job) for job in jobs]
+
+    table = pd.DataFrame(rows, columns=['k_burst', 'k_deg', 'burst_size', 'N_CELLS', 'fano', 'mean',
+                                        'variance', 'time', 'rounds', 'converged'])
+    table['N_CELLS'] = table['N_CELLS'].astype(int)
+    table['seed'] = ['{}/{}'.format(root.entropy, i) for i in range(len(jobs))]
+
+    return table
+
+
+
+def sweep_job(job):
+    """ Run one parameter combination of gillespie_sweep with its own seed. """
+    import numpy as np
+    from gillespie_ensemble_function import gillespie_ensemble
+
+    (k_burst, k_deg, burst_size, N_CELLS), seed_seq, engine = job
+
+    ss_distr, info = gillespie_ensemble(int(N_CELLS), k_burst, k_deg, burst_size, engine=engine,
+                                        full_output=True, rng=np.random.default_rng(seed_seq))
+
+    return [k_burst, k_deg, burst_size, N_CELLS, info['fano'], info['mean'], info['variance'],
+            info['time'], info['rounds'], info['converged']]
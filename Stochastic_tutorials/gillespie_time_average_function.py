@@ -3,12 +3,43 @@
 
 # In[52]:
 
-def gillespie_time_average(N_RUNS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0):
+def gillespie_time_average(N_RUNS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0, rng = None,
+                           method = 'ssa', tau = None, eps = 0.03, output = 'trajectory', burn_in = 0.0):
+    """
+    Simulate the mRNA content of a single cell with bursty transcription and first order
+    degradation, starting from 0 mRNA.
+
+    Arguments
+    ---------
+    N_RUNS : int, the number of steps.
+    rng : a numpy Generator, or a seed for one (int or SeedSequence). None uses fresh entropy.
+    method : 'ssa' (default) is the exact Gillespie algorithm, one event per step.
+             'tau_leap' and 'adaptive_tau' are the approximate tau-leaping engines of
+             tau_leap_time_average, which fire many events per step.
+    tau, eps : step size and error control of the tau-leaping engines, see tau_leap_time_average.
+    output : 'trajectory' (default) returns every step. 'histogram' does not store the steps,
+             but accumulates the time-weighted distribution of the mRNA content while the
+             simulation runs. It needs integer copy numbers, i.e. an integer burst_size.
+    burn_in : float, with output='histogram' the time before which nothing is counted.
+
+    Returns
+    -------
+    output='trajectory': two lists, the time of every step and the mRNA content from that time on.
+    output='histogram': a numpy array p with p[n] the fraction of time spent with n mRNA, and
+                        a dictionary with its mean, variance, fano, skewness, kurtosis and the
+                        counted time (see moments_function.Occupancy).
+    """
+
+    if method in ('tau_leap', 'adaptive_tau'):
+        return tau_leap_time_average(N_RUNS, k_burst, k_deg, burst_size, rng,
+                                     adaptive=(method == 'adaptive_tau'), tau=tau, eps=eps,
+                                     output=output, burn_in=burn_in)
+    elif method != 'ssa':
+        raise ValueError("Unknown method {}. Choose from: 'ssa', 'tau_leap' and 'adaptive_tau'.".format(method))
     
-    import random
     import numpy as np
-    import math
-    import operator
+    from random_blocks_function import RandomBlocks
+    from propensity_function import MassAction
     
     # Parameters
     k_burst    = k_burst
@@ -17,35 +48,31 @@ def gillespie_time_average(N_RUNS = 5000, k_burst = 50.0, k_deg = 1.0, burst_siz
     burst_size = burst_size
     deg_size     = 1
 
+    deg_propensity = MassAction(k_deg, [deg_size]) # k_deg*n!/(n-deg_size)!
+
+    # Random numbers: rng is a numpy Generator or a seed for one, None uses fresh entropy
+    random_blocks = RandomBlocks(rng)
+
     # Initial conditions
     t_0 = 0
     initial_mrna_zero = 0
     
-    cell_status = {}
-    cell_status[t_0] = initial_mrna_zero
-
     N_RUNS = N_RUNS
 
     #1 : Initialise species and parameters!
 
-    cell_status ={}
-    t_0 = 0
-    initial_mrna_zero = 0
-
-    cell_status[t_0] = initial_mrna_zero
+    cell_status = time_average_recorder(N_RUNS, output, burn_in)
+    cell_status.append(t_0, initial_mrna_zero)
 
     #4 : Iterations of step 2 & 3
 
     for run in range(N_RUNS):
 
-        last_time_point = max(cell_status.keys())
-
+        last_time_point = cell_status.last_time
+        last_mrna = cell_status.last_value
 
-        if cell_status[last_time_point] >= deg_size:
-            Propensity_deg = k_deg*(math.factorial(cell_status[last_time_point])/(math.factorial(cell_status[last_time_point] - deg_size)))
 
-        else:
-            Propensity_deg = 0.0
+        Propensity_deg = deg_propensity(last_mrna) # 0 when there are fewer than deg_size molecules
 
         Propensity_burst = k_burst
 
@@ -60,27 +87,196 @@ def gillespie_time_average(N_RUNS = 5000, k_burst = 50.0, k_deg = 1.0, burst_siz
         # determine step-size in time (first RANDOM number)
 
         lambdA = (SUM_propensities)
-        delta_time = random.expovariate(lambdA)
+        delta_time = random_blocks.exponential()/lambdA
 
         current_time = last_time_point
-        new_time = round((current_time + delta_time), 3)
+        new_time = current_time + delta_time
 
         # pick a second RANDOM number that decides which event takes place: bursting or degradation
 
-        r = random.random()
+        r = random_blocks.uniform()
 
         # HERE is where I update the cell mRNA content in case of BURSTING
 
         if r <= P_burst: 
-            cell_status[new_time] = cell_status[last_time_point] + burst_size 
+            cell_status.append(new_time, last_mrna + burst_size)
         # HERE is where I update the cell mRNA content in case of DEGRADATION
         elif r > 1.0 - P_deg: 
-            cell_status[new_time] = cell_status[last_time_point] - deg_size 
+            cell_status.append(new_time, last_mrna - deg_size)
     
-    sorted_cell_status = sorted(cell_status.items(), key= operator.itemgetter(0))
+    if output == 'histogram':
+        return cell_status.histogram(), cell_status.moments()
+
+    times, mrna = cell_status.arrays()
     
-    time_steps = [x[0] for x in sorted_cell_status]
-    mRNA_trajectory = [x[1] for x in sorted_cell_status]
+    time_steps = times.tolist()
+    mRNA_trajectory = mrna.tolist()
     # the output of this function are 2 lists:
     return time_steps, mRNA_trajectory
 
+
+
+def time_average_recorder(N_RUNS, output, burn_in):
+    """ Return the object that records the steps of a single-cell simulation. """
+    from trajectory_function import Trajectory
+    from moments_function import Occupancy
+
+    if output == 'trajectory':
+        return Trajectory(capacity=N_RUNS + 1) # one point per step, with room for all of them
+    elif output == 'histogram':
+        return Occupancy(burn_in)
+    else:
+        raise ValueError("Unknown output {}. Choose from: 'trajectory' and 'histogram'.".format(output))
+
+
+
+
+def tau_leap_time_average(N_RUNS = 5000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0, rng = None,
+                          adaptive = True, tau = None, eps = 0.03, output = 'trajectory', burn_in = 0.0):
+    """
+    Approximate version of gillespie_time_average: each step leaps over a time tau and fires a
+    Poisson distributed number of bursts and degradations, with the propensities at the start
+    of the leap. The cost per unit of simulated time no longer grows with k_burst and the mRNA
+    content.
+
+    Error control
+    -------------
+    adaptive = False : every leap has length tau, by default eps times the mRNA life time
+                       (eps/k_deg).
+    adaptive = True  : the leap is chosen every step such that the expected change and the
+                       standard deviation of the mRNA content stay below eps times its value
+                       (Cao, Gillespie & Petzold 2006). The expected change is bounded for
+                       bursts and degradations separately: close to steady state they cancel,
+                       and a bound on their sum alone allows leaps longer than the mRNA life
+                       time. When the leap would hold fewer than 10 events, an exact Gillespie
+                       step is taken instead.
+    In both cases a leap that would make the mRNA content negative is retried with half the
+    length. The Poisson numbers are drawn from the blocks of RandomBlocks. The simulation ends
+    early when no reaction can fire any more (k_burst = 0 and no mRNA left).
+
+    Returns
+    -------
+    The same as gillespie_time_average for the given output.
+    """
+
+    import numpy as np
+    from random_blocks_function import RandomBlocks
+    from propensity_function import MassAction
+
+    deg_size = 1
+
+    deg_propensity = MassAction(k_deg, [deg_size]) # k_deg*n!/(n-deg_size)!
+
+    rng = np.random.default_rng(rng)
+    random_blocks = RandomBlocks(rng)
+
+    if tau is None:
+        tau = eps/k_deg
+
+    cell_status = time_average_recorder(N_RUNS, output, burn_in)
+    cell_status.append(0, 0)
+
+    t = 0.0
+    mrna = 0
+
+    for run in range(N_RUNS):
+
+        Propensity_deg = deg_propensity(mrna)
+        Propensity_burst = k_burst
+        SUM_propensities = Propensity_deg + Propensity_burst
+
+        if SUM_propensities == 0:
+            break # nothing can happen any more
+
+        if adaptive:
+            # expected change in mRNA per unit of time by each reaction, and the variance of the total
+            flux_burst = burst_size*Propensity_burst
+            flux_deg = deg_size*Propensity_deg
+            spread = burst_size**2*Propensity_burst + deg_size**2*Propensity_deg
+
+            bound = max(eps*mrna/deg_size, 1.0) # allowed change; deg_size is the order of degradation
+            if spread > 0:
+                leap = min(bound**2/spread, bound/max(flux_burst, flux_deg))
+            else:
+                leap = 0.0 # no reaction changes the mRNA content: exact steps only move the time on
+
+            if leap*SUM_propensities < 10:
+                # too few events to leap over: take one exact step
+                t += random_blocks.exponential()/SUM_propensities
+                r = random_blocks.uniform()
+
+                if r <= Propensity_burst/SUM_propensities:
+                    mrna += burst_size
+                elif r > 1.0 - Propensity_deg/SUM_propensities:
+                    mrna -= deg_size
+
+                cell_status.append(t, mrna)
+                continue
+        else:
+            leap = tau
+
+        while True:
+            n_burst = random_blocks.poisson(Propensity_burst*leap)
+            n_deg = random_blocks.poisson(Propensity_deg*leap)
+            new_mrna = mrna + n_burst*burst_size - n_deg*deg_size
+
+            if new_mrna >= 0:
+                break
+            leap /= 2 # too many degradations: retry a shorter leap
+
+        t += leap
+        mrna = new_mrna
+        cell_status.append(t, mrna)
+
+    if output == 'histogram':
+        return cell_status.histogram(), cell_status.moments()
+
+    times, mrna_content = cell_status.arrays()
+
+    return times.tolist(), mrna_content.tolist()
+
+
+
+def benchmark_time_average(N_RUNS = 100000, k_burst = 50.0, k_deg = 1.0, burst_size = 1.0,
+                           methods = ['ssa', 'tau_leap', 'adaptive_tau'], burn_in = None, rng = 0):
+    """
+    Run gillespie_time_average with each method and compare speed and accuracy.
+
+    The mean and Fano factor are averaged over time, after dropping the first burn_in time
+    units (by default 5 mRNA life times, 5/k_deg), and compared with the theoretical
+    values of the model. Every method uses a random stream spawned from the same seed.
+
+    Returns
+    -------
+    A pandas DataFrame with one row per method and the columns steps, simulated time (after
+    the burn in), seconds, time per second (simulated time per second of computing), mean,
+    Fano factor and their relative errors.
+    """
+
+    import time
+    import numpy as np
+    import pandas as pd
+
+    if burn_in is None:
+        burn_in = 5.0/k_deg
+
+    deg_size = 1
+    theor_mean = (k_burst*burst_size)/(k_deg*deg_size)
+    theor_fano = (deg_size + burst_size)/(2.0*deg_size)
+
+    seeds = np.random.SeedSequence(rng).spawn(len(methods))
+
+    rows = []
+    for method, seed in zip(methods, seeds):
+        start = time.perf_counter()
+        occupancy, moments = gillespie_time_average(N_RUNS, k_burst, k_deg, burst_size, rng=seed,
+                                                    method=method, output='histogram', burn_in=burn_in)
+        seconds = time.perf_counter() - start
+
+        mean, fano = moments['mean'], moments['fano']
+
+        rows.append([method, N_RUNS, moments['time'], seconds, moments['time']/seconds, mean, fano,
+                     mean/theor_mean - 1, fano/theor_fano - 1])
+
+    return pd.DataFrame(rows, columns=['method', 'steps', 'simulated time', 'seconds', 'time per second',
+                                       'mean', 'Fano factor', 'mean error', 'Fano error'])
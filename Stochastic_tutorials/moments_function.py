@@ -0,0 +1,166 @@
+# coding: utf-8
+
+import numpy as np
+
+
+class Moments:
+    """
+    Running mean, variance, skewness and kurtosis of a stream of values.
+
+    The central moment sums are updated one value at a time with Welford's method extended
+    to the 3rd and 4th moment, so the values themselves are never stored. Batches of values
+    (update_array) and other accumulators (merge) are combined with the pairwise formulas of
+    Chan et al. and Pebay.
+
+    The statistics follow numpy and scipy.stats defaults: the variance divides by n, the
+    skewness and kurtosis are the biased estimators and the kurtosis is the excess kurtosis
+    (0 for a normal distribution). Statistics that are undefined, like the skewness of equal
+    values or the Fano factor of a mean of 0, are nan.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mu = 0.0
+        self.M2 = 0.0
+        self.M3 = 0.0
+        self.M4 = 0.0
+
+    def update(self, x):
+        """ Add a single value. """
+        n1 = self.n
+        self.n += 1
+        n = self.n
+
+        delta = x - self.mu
+        delta_n = delta/n
+        delta_n2 = delta_n*delta_n
+        term1 = delta*delta_n*n1
+
+        self.mu += delta_n
+        self.M4 += term1*delta_n2*(n*n - 3*n + 3) + 6*delta_n2*self.M2 - 4*delta_n*self.M3
+        self.M3 += term1*delta_n*(n - 2) - 3*delta_n*self.M2
+        self.M2 += term1
+
+    def update_array(self, x):
+        """ Add all values of an array at once. """
+        x = np.asarray(x, dtype=np.float64).ravel()
+        if len(x) == 0:
+            return self
+
+        batch = Moments()
+        batch.n = len(x)
+        batch.mu = x.mean()
+        d = x - batch.mu
+        d2 = d*d
+        batch.M2 = d2.sum()
+        batch.M3 = (d2*d).sum()
+        batch.M4 = (d2*d2).sum()
+
+        return self.merge(batch)
+
+    def merge(self, other):
+        """ Add the values seen by another Moments object. """
+        na, nb = self.n, other.n
+        if nb == 0:
+            return self
+        n = na + nb
+
+        delta = other.mu - self.mu
+        delta2 = delta*delta
+
+        M2 = self.M2 + other.M2 + delta2*na*nb/n
+        M3 = (self.M3 + other.M3 + delta2*delta*na*nb*(na - nb)/n**2
+              + 3*delta*(na*other.M2 - nb*self.M2)/n)
+        M4 = (self.M4 + other.M4 + delta2*delta2*na*nb*(na*na - na*nb + nb*nb)/n**3
+              + 6*delta2*(na*na*other.M2 + nb*nb*self.M2)/n**2
+              + 4*delta*(na*other.M3 - nb*self.M3)/n)
+
+        self.n = n
+        self.mu += delta*nb/n
+        self.M2, self.M3, self.M4 = M2, M3, M4
+
+        return self
+
+    @property
+    def mean(self):
+        return self.mu
+
+    @property
+    def variance(self):
+        return self.M2/self.n
+
+    @property
+    def fano(self):
+        return self.variance/self.mu if self.mu != 0 else np.nan
+
+    @property
+    def skewness(self):
+        return np.sqrt(self.n)*self.M3/self.M2**1.5 if self.M2 > 0 else np.nan
+
+    @property
+    def kurtosis(self):
+        return self.n*self.M4/self.M2**2 - 3.0 if self.M2 > 0 else np.nan
+
+
+
+class Occupancy:
+    """
+    Time-weighted distribution of a copy number along a single trajectory, accumulated while
+    the simulation runs instead of from the stored trajectory.
+
+    Points are added with append(t, n) as for a Trajectory: the copy number n holds from time t
+    until the next point. The time it holds after burn_in is added to the bin of n, so only
+    one float per copy number is kept. The bins are the integer copy numbers, so a
+    non-integer n (e.g. from a non-integer burst size) raises a ValueError.
+
+    Arguments
+    ---------
+    burn_in : float, the time before which nothing is counted.
+    """
+
+    def __init__(self, burn_in=0.0):
+        self.burn_in = burn_in
+        self.durations = [] # durations[n] is the time spent with copy number n
+        self.last_time = None
+        self.last_value = None
+        self.last_bin = None
+
+    def append(self, t, n):
+        if n != int(n):
+            raise ValueError('Occupancy bins integer copy numbers, got {}. Use the trajectory output '
+                             'for non-integer copy numbers.'.format(n))
+
+        if t > self.burn_in and self.last_time is not None:
+            start = self.last_time if self.last_time > self.burn_in else self.burn_in
+            try:
+                self.durations[self.last_bin] += t - start
+            except IndexError:
+                self.durations.extend([0.0]*(self.last_bin + 1 - len(self.durations)))
+                self.durations[self.last_bin] += t - start
+
+        self.last_time = t
+        self.last_value = n
+        self.last_bin = int(n)
+
+    def histogram(self):
+        """ Return an array p with p[n] the fraction of the counted time spent with copy number n. """
+        durations = np.array(self.durations)
+        total = durations.sum()
+        if total == 0:
+            raise ValueError('No time was counted: the trajectory ends before the burn in of {}.'.format(self.burn_in))
+
+        return durations/total
+
+    def moments(self):
+        """ Return a dictionary with the time-weighted mean, variance, fano, skewness and
+        kurtosis (excess) of the copy number, and the counted 'time'. """
+        p = self.histogram()
+        n = np.arange(len(p))
+
+        mean = np.dot(p, n)
+        d = n - mean
+        variance = np.dot(p, d**2)
+
+        return {'mean': mean, 'variance': variance, 'fano': variance/mean,
+                'skewness': np.dot(p, d**3)/variance**1.5, 'kurtosis': np.dot(p, d**4)/variance**2 - 3.0,
+                'time': float(np.sum(self.durations))}
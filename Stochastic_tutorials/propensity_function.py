@@ -0,0 +1,85 @@
+# coding: utf-8
+
+import numpy as np
+from scipy.special import gammaln
+
+
+# reactions of higher order than this are evaluated in log space
+MAX_PRODUCT_ORDER = 8
+
+
+def falling_factorial(n, k):
+    """
+    Return n!/(n-k)! = n*(n-1)*...*(n-k+1), the number of ordered ways to pick k molecules out
+    of n, and 0 when n < k.
+
+    For orders up to MAX_PRODUCT_ORDER the k factors are multiplied, so the cost does not
+    depend on n. Higher orders are evaluated as exp(lnGamma(n+1) - lnGamma(n-k+1)), which
+    neither builds big integers nor overflows before the result itself does.
+
+    Arguments
+    ---------
+    n : copy number(s), an int, float or numpy array.
+    k : int, the reaction order.
+    """
+
+    n = np.asarray(n, dtype=np.float64)
+
+    if k <= MAX_PRODUCT_ORDER:
+        result = np.ones(n.shape)
+        for i in range(k):
+            result *= np.maximum(n - i, 0.0)
+    else:
+        enough = n >= k
+        m = np.where(enough, n, k)
+        result = np.where(enough, np.exp(gammaln(m + 1) - gammaln(m - k + 1)), 0.0)
+
+    return result[()] # a float for scalar input
+
+
+
+class MassAction:
+    """
+    The propensity of a mass-action reaction: rate * prod_i n_i!/(n_i - s_i)!, with n_i the
+    copy number and s_i the number of consumed molecules of each reactant.
+
+    Calling the object with the reactant copy numbers returns the propensity of that state.
+    Values are cached per state, so a simulation that revisits a state does not evaluate it
+    again. The cache is emptied when it holds more than max_cache states. array() evaluates
+    many states at once, without the cache.
+
+    Arguments
+    ---------
+    rate : float, the rate constant.
+    orders : list with s_i for every reactant. An empty list gives a constant propensity
+             (zeroth order, e.g. transcription).
+    max_cache : int
+    """
+
+    def __init__(self, rate, orders, max_cache=100000):
+        self.rate = rate
+        self.orders = [int(s) for s in orders]
+        self.max_cache = max_cache
+        self.cache = {}
+
+    def __call__(self, *counts):
+        try:
+            return self.cache[counts]
+        except KeyError:
+            pass
+
+        if len(self.cache) >= self.max_cache:
+            self.cache.clear()
+
+        value = float(self.array(*counts))
+        self.cache[counts] = value
+
+        return value
+
+    def array(self, *counts):
+        """ Return the propensities for arrays of copy numbers, one argument per reactant. """
+        result = self.rate
+        for n, s in zip(counts, self.orders):
+            result = result*falling_factorial(n, s)
+
+        return result
@@ -0,0 +1,74 @@
+# coding: utf-8
+
+import math
+import numpy as np
+
+
+# Poisson numbers with a larger mean are drawn from the Generator in blocks per mean, of at
+# most POISSON_BLOCK_MAX values, for at most POISSON_MAX_MEANS means at a time. See
+# RandomBlocks.poisson.
+POISSON_INVERSION_MAX = 5.0
+POISSON_BLOCK_MAX = 256
+POISSON_MAX_MEANS = 10000
+
+
+class RandomBlocks:
+    """
+    Scalar random numbers for event-by-event simulations, drawn from a numpy Generator in
+    blocks. Drawing one number at a time from a Generator costs far more than taking it from
+    a pregenerated block.
+
+    Arguments
+    ---------
+    rng : a numpy Generator, or anything np.random.default_rng accepts (None, an int seed or a
+          SeedSequence).
+    block_size : int, the number of values drawn at once.
+    """
+
+    def __init__(self, rng=None, block_size=8192):
+        self.rng = np.random.default_rng(rng)
+        self.block_size = block_size
+        self.exponentials = []
+        self.uniforms = []
+        self.poissons = {} # mean -> [values, size of the next block]
+
+    def exponential(self):
+        """ Return a standard exponential number (rate 1). Divide by a rate to get the waiting
+        time of a Poisson process with that rate. """
+        if not self.exponentials:
+            self.exponentials = self.rng.standard_exponential(self.block_size).tolist()
+        return self.exponentials.pop()
+
+    def uniform(self):
+        """ Return a uniform number in [0, 1). """
+        if not self.uniforms:
+            self.uniforms = self.rng.random(self.block_size).tolist()
+        return self.uniforms.pop()
+
+    def poisson(self, lam):
+        """ Return a Poisson number with mean lam. Means up to POISSON_INVERSION_MAX are drawn
+        by inversion from a single uniform number, which takes about lam + 1 steps. Larger
+        means are drawn from the Generator in a block per mean. The block doubles every time a
+        mean comes back, so a mean that is used once costs a single draw, and the means of a
+        fixed-step simulation (a rate times a copy number times the step) are drawn in bulk. """
+        if lam > POISSON_INVERSION_MAX:
+            entry = self.poissons.get(lam)
+            if entry is None:
+                if len(self.poissons) >= POISSON_MAX_MEANS:
+                    self.poissons.clear()
+                entry = self.poissons[lam] = [[], 1]
+            if not entry[0]:
+                entry[0] = self.rng.poisson(lam, entry[1]).tolist()
+                entry[1] = min(2*entry[1], POISSON_BLOCK_MAX)
+            return entry[0].pop()
+
+        u = self.uniform()
+        p = math.exp(-lam)
+        cdf = p
+        k = 0
+        while u > cdf and p > 0: # p underflows to 0 if rounding keeps cdf below u
+            k += 1
+            p *= lam/k
+            cdf += p
+
+        return k
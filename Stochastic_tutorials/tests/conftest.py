@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the tutorial modules import each other by module name from the Stochastic_tutorials directory
+tutorial_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, tutorial_dir)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from brownian_function import brownian, brownian_chunks, brownian_to_file
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1000])
+def test_chunked_equals_unchunked_for_scalar_x0(chunk_size):
+    path = brownian(2.0, 500, 0.01, 0.5, rng=4)
+
+    assert np.allclose(brownian(2.0, 500, 0.01, 0.5, rng=4, chunk_size=chunk_size), path)
+    assert np.allclose(np.concatenate(list(brownian_chunks(2.0, 500, 0.01, 0.5, chunk_size, rng=4))), path)
+
+
+def test_chunked_array_x0():
+    x0 = np.array([[0.0, 1.0], [5.0, -3.0]])
+    paths = brownian(x0, 1000, 0.01, 2.0, rng=0, chunk_size=64)
+
+    assert paths.shape == (2, 2, 1000)
+    # the steps are independent normals with variance delta**2*dt, also across chunk borders
+    steps = np.diff(np.concatenate([x0[..., None], paths], axis=-1), axis=-1)
+    assert steps.std() == pytest.approx(2.0*np.sqrt(0.01), rel=0.05)
+    assert np.abs(steps[..., 63:66]).max() < 1.0
+
+
+def test_brownian_to_file(tmp_path):
+    filename = str(tmp_path / 'paths.npy')
+    x0 = np.zeros(3)
+
+    paths = brownian_to_file(filename, x0, 300, 0.1, 1.0, chunk_size=50, rng=9)
+
+    assert isinstance(paths, np.memmap)
+    assert np.array_equal(paths, brownian(x0, 300, 0.1, 1.0, rng=9, chunk_size=50))
+    assert np.array_equal(np.load(filename), paths)
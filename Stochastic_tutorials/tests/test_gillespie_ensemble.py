@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import warnings
+
+from gillespie_ensemble_function import fano_converged, gillespie_ensemble
+
+
+def ensemble_moments(engine, seeds):
+    infos = [gillespie_ensemble(1000, k_burst=50.0, k_deg=1.0, burst_size=1.0, engine=engine,
+                                full_output=True, rng=seed)[1] for seed in seeds]
+    return np.mean([info['mean'] for info in infos]), np.mean([info['fano'] for info in infos])
+
+
+def test_numpy_engine_matches_cells_engine():
+    # the tutorial parameters: mean 50 and Fano factor 1 in steady state
+    numpy_mean, numpy_fano = ensemble_moments('numpy', [0, 1, 2])
+    cells_mean, cells_fano = ensemble_moments('cells', [3, 4, 5])
+
+    assert numpy_mean == pytest.approx(cells_mean, rel=0.01)
+    assert numpy_fano == pytest.approx(cells_fano, abs=0.1)
+    assert numpy_mean == pytest.approx(50.0, rel=0.01)
+    assert numpy_fano == pytest.approx(1.0, abs=0.25)
+
+
+def test_numpy_engine_is_reproducible():
+    first = gillespie_ensemble(200, engine='numpy', rng=7)
+    assert gillespie_ensemble(200, engine='numpy', rng=7) == first
+    assert len(first) == 200
+
+
+def test_single_cell_converges_without_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        ss_distr, info = gillespie_ensemble(1, engine='numpy', full_output=True, rng=0)
+
+    assert info['converged'] and info['fano'] == 0
+    assert len(ss_distr) == 1
+
+
+def test_fano_converged():
+    assert fano_converged([1.0, 1.0, 1.0, 1.0, 1.0, 1.005], 0.01)
+    assert not fano_converged([1.0, 1.0, 1.0, 1.0, 0.9, 1.0], 0.01)
+    assert fano_converged([0.0]*6, 0.01)
+    assert not fano_converged([0.0]*5 + [0.1], 0.01)
+
+
+def test_cells_engine_is_reproducible():
+    first, info = gillespie_ensemble(200, engine='cells', full_output=True, rng=7)
+
+    assert gillespie_ensemble(200, engine='cells', rng=7) == first
+    assert len(first) == 200 and info['converged']
+
+
+@pytest.mark.parametrize('N_CELLS', [2, 3])
+def test_cells_engine_schedules_small_ensembles(N_CELLS):
+    # fewer cells than 1/perc_cells_to_update: the heap still hands out one cell per round
+    ss_distr, info = gillespie_ensemble(N_CELLS, engine='cells', full_output=True, rng=0)
+
+    assert len(ss_distr) == N_CELLS
+    assert info['time'] > 0
@@ -0,0 +1,21 @@
+from gillespie_sweep_function import gillespie_sweep
+
+
+def test_sweep_does_not_depend_on_processes():
+    params = dict(k_burst=[20.0, 50.0], burst_size=[1.0, 2.0], N_CELLS=1000, seed=3)
+
+    serial = gillespie_sweep(processes=1, **params)
+    pooled = gillespie_sweep(processes=2, **params)
+
+    assert serial.equals(pooled)
+    assert len(serial) == 4
+    assert serial[['k_burst', 'burst_size']].values.tolist() == [[20.0, 1.0], [20.0, 2.0], [50.0, 1.0], [50.0, 2.0]]
+
+
+def test_sweep_seed_reproduces_a_run():
+    first = gillespie_sweep(k_burst=[20.0, 50.0], N_CELLS=1000, seed=3, processes=1)
+    again = gillespie_sweep(k_burst=[20.0, 50.0], N_CELLS=1000, seed=3, processes=1)
+    other = gillespie_sweep(k_burst=[20.0, 50.0], N_CELLS=1000, seed=4, processes=1)
+
+    assert first.equals(again)
+    assert not first['fano'].equals(other['fano'])
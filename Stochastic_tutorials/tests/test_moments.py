@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import warnings
+from scipy import stats
+
+from moments_function import Moments
+
+
+def reference(x):
+    return {'mean': np.mean(x), 'variance': np.var(x), 'fano': np.var(x)/np.mean(x),
+            'skewness': stats.skew(x), 'kurtosis': stats.kurtosis(x)}
+
+
+def statistics(moments):
+    return {name: getattr(moments, name) for name in ['mean', 'variance', 'fano', 'skewness', 'kurtosis']}
+
+
+def test_update_matches_numpy_and_scipy():
+    x = np.random.default_rng(0).negative_binomial(5, 0.1, size=2000).astype(float)
+
+    moments = Moments()
+    for value in x:
+        moments.update(value)
+
+    assert statistics(moments) == pytest.approx(reference(x), rel=1e-9)
+
+
+def test_update_array_and_merge_match_update():
+    rng = np.random.default_rng(1)
+    x = rng.gamma(2.0, 10.0, size=3000)
+
+    batches = Moments()
+    for part in np.array_split(x, [10, 11, 500, 2999]):
+        batches.update_array(part)
+    merged = Moments().update_array(x[:1000]).merge(Moments().update_array(x[1000:]))
+
+    assert batches.n == merged.n == len(x)
+    assert statistics(batches) == pytest.approx(reference(x), rel=1e-9)
+    assert statistics(merged) == pytest.approx(reference(x), rel=1e-9)
+
+
+def test_undefined_statistics_are_nan():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        constant = Moments().update_array([3.0, 3.0, 3.0])
+        zeros = Moments().update_array([0.0, 0.0])
+
+        assert constant.fano == 0.0
+        assert np.isnan(constant.skewness) and np.isnan(constant.kurtosis)
+        assert np.isnan(zeros.fano)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from gillespie_time_average_function import gillespie_time_average
+from moments_function import Moments, Occupancy
+
+
+def test_equal_durations_match_moments():
+    values = np.random.default_rng(0).poisson(30, size=500)
+
+    occupancy = Occupancy()
+    for t, n in enumerate(values):
+        occupancy.append(float(t), n)
+    occupancy.append(float(len(values)), 0) # closes the time of the last value
+
+    moments = Moments().update_array(values)
+    result = occupancy.moments()
+
+    assert result['time'] == len(values)
+    for name in ['mean', 'variance', 'fano', 'skewness', 'kurtosis']:
+        assert result[name] == pytest.approx(getattr(moments, name), rel=1e-9)
+
+
+def test_histogram_matches_the_trajectory():
+    times, mrna = gillespie_time_average(20000, rng=0)
+    p, moments = gillespie_time_average(20000, rng=0, output='histogram', burn_in=2.0)
+
+    times, mrna = np.array(times), np.array(mrna)
+    durations = np.diff(np.maximum(times, 2.0))
+    expected = np.bincount(mrna[:-1], weights=durations)
+
+    assert np.allclose(p, expected/expected.sum())
+    assert moments['mean'] == pytest.approx(np.average(mrna[:-1], weights=durations))
+    assert moments['time'] == pytest.approx(times[-1] - 2.0)
+
+
+def test_non_integer_copy_numbers_are_rejected():
+    occupancy = Occupancy()
+    occupancy.append(0.0, 2.0)
+    with pytest.raises(ValueError):
+        occupancy.append(1.0, 3.5)
+
+    with pytest.raises(ValueError):
+        gillespie_time_average(100, burst_size=1.5, rng=0, output='histogram')
@@ -0,0 +1,34 @@
+import math
+import numpy as np
+import pytest
+
+from propensity_function import MAX_PRODUCT_ORDER, MassAction, falling_factorial
+
+
+@pytest.mark.parametrize('k', [0, 1, 2, 3, MAX_PRODUCT_ORDER, MAX_PRODUCT_ORDER + 1, 15])
+def test_falling_factorial_matches_factorials(k):
+    for n in range(0, 40):
+        expected = math.factorial(n)//math.factorial(n - k) if n >= k else 0
+        assert falling_factorial(n, k) == pytest.approx(expected, rel=1e-9)
+
+
+def test_falling_factorial_of_arrays():
+    n = np.arange(10)
+    assert falling_factorial(n, 2).tolist() == [0, 0, 2, 6, 12, 20, 30, 42, 56, 72]
+    assert isinstance(falling_factorial(5, 2), float)
+
+
+def test_mass_action():
+    dimerisation = MassAction(0.5, [2, 1])
+
+    assert dimerisation(4, 3) == 0.5*4*3*3
+    assert dimerisation(1, 3) == 0.0
+    assert dimerisation.array(np.array([4, 1]), np.array([3, 3])).tolist() == [18.0, 0.0]
+    assert MassAction(7.0, [])() == 7.0
+
+
+def test_mass_action_cache_is_bounded():
+    propensity = MassAction(1.0, [1], max_cache=3)
+    for n in range(10):
+        assert propensity(n) == n
+    assert len(propensity.cache) <= 3
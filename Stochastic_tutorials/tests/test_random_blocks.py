@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from brownian_function import brownian
+from gillespie_time_average_function import gillespie_time_average
+from random_blocks_function import RandomBlocks
+
+
+def test_blocks_follow_the_seed():
+    first, again, other = RandomBlocks(5, block_size=16), RandomBlocks(5, block_size=16), RandomBlocks(6, block_size=16)
+
+    values = [(first.exponential(), first.uniform()) for i in range(100)]
+
+    assert values == [(again.exponential(), again.uniform()) for i in range(100)]
+    assert values != [(other.exponential(), other.uniform()) for i in range(100)]
+
+
+def test_block_distributions():
+    blocks = RandomBlocks(0)
+    exponentials = np.array([blocks.exponential() for i in range(20000)])
+    uniforms = np.array([blocks.uniform() for i in range(20000)])
+
+    assert exponentials.min() >= 0 and exponentials.mean() == pytest.approx(1.0, abs=0.03)
+    assert 0 <= uniforms.min() and uniforms.max() < 1 and uniforms.mean() == pytest.approx(0.5, abs=0.01)
+
+
+def test_seeded_functions_are_reproducible():
+    generator = np.random.default_rng(np.random.SeedSequence(11))
+
+    assert gillespie_time_average(500, rng=11) == gillespie_time_average(500, rng=generator)
+    assert gillespie_time_average(500, rng=11) != gillespie_time_average(500, rng=12)
+    assert np.array_equal(brownian(0.0, 100, 0.1, 1.0, rng=3), brownian(0.0, 100, 0.1, 1.0, rng=3))
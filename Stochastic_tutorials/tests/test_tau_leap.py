@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from gillespie_time_average_function import gillespie_time_average
+from random_blocks_function import POISSON_INVERSION_MAX, RandomBlocks
+
+
+@pytest.mark.parametrize('method', ['tau_leap', 'adaptive_tau'])
+def test_tau_leaping_stays_close_to_ssa(method):
+    # k_burst = 500 so that the adaptive engine leaps instead of taking exact steps. The
+    # stated tolerance: mean within 2% of the exact simulation, and Fano factor within 0.1 of
+    # its theoretical value of 1 (the Fano factor of the exact run itself varies too much).
+    exact = gillespie_time_average(300000, k_burst=500.0, rng=0, output='histogram', burn_in=5.0)[1]
+    approx = gillespie_time_average(100000, k_burst=500.0, rng=1, method=method, output='histogram',
+                                    burn_in=5.0)[1]
+
+    assert approx['mean'] == pytest.approx(exact['mean'], rel=0.02)
+    assert approx['fano'] == pytest.approx(1.0, abs=0.1)
+    assert approx['time'] > exact['time'] # the point of leaping
+
+
+@pytest.mark.parametrize('method', ['tau_leap', 'adaptive_tau'])
+def test_tau_leaping_stops_when_nothing_can_happen(method):
+    times, mrna = gillespie_time_average(100, k_burst=0.0, rng=0, method=method)
+
+    assert times == [0.0] and mrna == [0]
+
+
+@pytest.mark.parametrize('lam', [0.3, 2.0, POISSON_INVERSION_MAX, 20.0, 150.0])
+def test_poisson_blocks(lam):
+    blocks = RandomBlocks(0)
+    values = np.array([blocks.poisson(lam) for i in range(20000)])
+
+    assert values.mean() == pytest.approx(lam, rel=0.03)
+    assert values.var() == pytest.approx(lam, rel=0.06)
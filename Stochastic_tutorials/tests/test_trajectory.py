@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from trajectory_function import Trajectory
+
+
+def test_value_at_and_drop_before():
+    trajectory = Trajectory(capacity=2)
+    for t, n in [(0.0, 5), (1.0, 6), (1.0, 7), (2.5, 3)]:
+        trajectory.append(t, n)
+
+    assert trajectory.value_at(0.5) == 5
+    assert trajectory.value_at(1.0) == 7 # the last of two points at the same time
+    assert trajectory.value_at(10.0) == 3
+    with pytest.raises(ValueError):
+        trajectory.value_at(-1.0)
+
+    trajectory.drop_before(2.0)
+    assert len(trajectory) == 2
+    assert trajectory.value_at(2.0) == 7
+    assert (trajectory.last_time, trajectory.last_value) == (2.5, 3)
+
+
+def test_growing_keeps_the_points():
+    rng = np.random.default_rng(0)
+    times = np.cumsum(rng.exponential(size=1000))
+    counts = rng.integers(0, 100, size=1000)
+
+    trajectory = Trajectory(capacity=4)
+    for i, (t, n) in enumerate(zip(times, counts)):
+        trajectory.append(t, n)
+        if i%100 == 99:
+            trajectory.drop_before(times[i - 10])
+
+    kept_times, kept_counts = trajectory.arrays()
+    assert np.array_equal(kept_times, times[-11:])
+    assert np.array_equal(kept_counts, counts[-11:])
+    assert len(trajectory.times) < 1000 # dropped points were reclaimed instead of growing
+
+
+def test_non_integer_counts_switch_to_float():
+    trajectory = Trajectory()
+    trajectory.append(0.0, 2)
+    trajectory.append(1.0, 3.5)
+
+    assert trajectory.arrays()[1].tolist() == [2.0, 3.5]
@@ -0,0 +1,89 @@
+# coding: utf-8
+
+import numpy as np
+
+
+class Trajectory:
+    """
+    The trajectory of one species in a Gillespie simulation: a sequence of (time, copy number)
+    points, where each copy number holds from its time until the next point.
+
+    The points are stored in two preallocated arrays. Appending is amortized O(1): when the
+    arrays are full, the points that were dropped with drop_before are reclaimed first and the
+    capacity is doubled only if that does not free at least half of it. Every event is kept
+    as its own point, also when two events happen at (almost) the same time.
+
+    Arguments
+    ---------
+    capacity : int
+        The number of points that fit before the arrays have to grow.
+    dtype : numpy dtype of the copy numbers. An integer array switches to float64 when the
+            first non-integer value is appended (e.g. a non-integer burst size), so no value is
+            ever truncated.
+    """
+
+    def __init__(self, capacity=64, dtype=np.int64):
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.counts = np.empty(capacity, dtype=dtype)
+        self.integer = np.issubdtype(self.counts.dtype, np.integer)
+        self.start = 0 # index of the first point that was not dropped
+        self.stop = 0 # index after the last point
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def append(self, t, n):
+        """ Add the point (t, n). t must not be smaller than the time of the last point. """
+        if self.stop == len(self.times):
+            self.reserve()
+
+        if self.integer and isinstance(n, float) and not n.is_integer(): # keep floats from now on
+            self.counts = self.counts.astype(np.float64)
+            self.integer = False
+
+        self.times[self.stop] = t
+        self.counts[self.stop] = n
+        self.stop += 1
+
+    def reserve(self):
+        """ Make room for at least one more point. """
+        size = len(self)
+        capacity = len(self.times)
+
+        if size > capacity//2:
+            capacity *= 2
+
+        times = np.empty(capacity, dtype=np.float64)
+        counts = np.empty(capacity, dtype=self.counts.dtype)
+        times[:size] = self.times[self.start:self.stop]
+        counts[:size] = self.counts[self.start:self.stop]
+
+        self.times, self.counts = times, counts
+        self.start, self.stop = 0, size
+
+    def index_at(self, t):
+        """ Return the array index of the last point at or before time t. """
+        i = self.start + np.searchsorted(self.times[self.start:self.stop], t, side='right') - 1
+        if i < self.start:
+            raise ValueError('Time {} lies before the start of the trajectory.'.format(t))
+        return i
+
+    def value_at(self, t):
+        """ Return the copy number at time t, by binary search. """
+        return self.counts[self.index_at(t)]
+
+    def drop_before(self, t):
+        """ Drop the points that are no longer needed to look up times at or after t. """
+        self.start = self.index_at(t)
+
+    @property
+    def last_time(self):
+        return self.times[self.stop - 1]
+
+    @property
+    def last_value(self):
+        return self.counts[self.stop - 1]
+
+    def arrays(self):
+        """ Return the times and copy numbers of the kept points as two arrays (views). """
+        return self.times[self.start:self.stop], self.counts[self.start:self.stop]